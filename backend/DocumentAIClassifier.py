@@ -1,21 +1,24 @@
 from typing import Optional
 
-from google.api_core.client_options import ClientOptions
 from google.cloud import documentai  # type: ignore
 
+from docai_cache import document_cache
+from docai_clients import get_client
+from documents import DocumentInput, read_document
+from tracing import traced
+
 def process_document_sample(
     project_id: str,
     location: str,
     processor_id: str,
-    file_path: str,
+    document: DocumentInput,
     mime_type: str,
     field_mask: Optional[str] = None,
     processor_version_id: Optional[str] = None,
+    content_sha256: Optional[str] = None,
 ) -> None:
-    # You must set the `api_endpoint` if you use a location other than "us".
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    # Shared long-lived client for this location's endpoint
+    client = get_client(location)
 
     if processor_version_id:
         # The full resource name of the processor version, e.g.:
@@ -28,9 +31,8 @@ def process_document_sample(
         # `projects/{project_id}/locations/{location}/processors/{processor_id}`
         name = client.processor_path(project_id, location, processor_id)
 
-    # Read the file into memory
-    with open(file_path, "rb") as image:
-        image_content = image.read()
+    # Uploaded bytes are used as-is; paths are read into memory
+    image_content = read_document(document)
 
     # Load binary data
     raw_document = documentai.RawDocument(content=image_content, mime_type=mime_type)
@@ -52,11 +54,10 @@ def process_document_sample(
         process_options=process_options,
     )
 
-    result = client.process_document(request=request)
-
+    # Identical bytes sent to the same processor are served from the result cache
     # For a full list of `Document` object attributes, reference this page:
     # https://cloud.google.com/document-ai/docs/reference/rest/v1/Document
-    document = result.document
+    document = document_cache.process(client, request, content_sha256)
 
 
     # Read the text recognition output from the processor
@@ -72,14 +73,16 @@ def process_document_sample(
     return maxKey
 
 # Example usage:
-def document_classifier(temp_path):
+@traced("docai_classify")
+def document_classifier(document: DocumentInput, content_sha256: Optional[str] = None):
     doc_type = process_document_sample(
         project_id="genesis-genai-454505",
         location="us",
         processor_id="14e7ceab3f5db4d",
-        file_path=temp_path,
+        document=document,
         mime_type="application/pdf",
         field_mask="text,entities,pages.pageNumber",
-        processor_version_id="9d9f356e7d49f10f"
+        processor_version_id="9d9f356e7d49f10f",
+        content_sha256=content_sha256,
     )
     return doc_type
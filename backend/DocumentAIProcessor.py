@@ -1,22 +1,41 @@
-from typing import Optional
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 
-from google.api_core.client_options import ClientOptions
 from google.cloud import documentai  # type: ignore
 
+from docai_cache import document_cache
+from docai_clients import get_client
+from documents import DocumentInput, count_pdf_pages, read_document
+import tracing
+
+# "first_page" keeps the original single-page OCR; "all_pages" OCRs every page in shards
+OCR_MODE = os.getenv("OCR_MODE", "first_page")
+# Online processing accepts at most 15 pages per request for the OCR processor
+OCR_SHARD_PAGES = int(os.getenv("OCR_SHARD_PAGES", "15"))
+OCR_PROCESSOR_ID = "bad535317e51821f"
+_shard_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("OCR_SHARD_CONCURRENCY", "4")), thread_name_prefix="ocr-shard"
+)
+
+
+class IncompleteOCRError(RuntimeError):
+    pass
+
 
 def process_document_sample(
     project_id: str,
     location: str,
     processor_id: str,
-    file_path: str,
+    document: DocumentInput,
     mime_type: str,
     field_mask: Optional[str] = None,
     processor_version_id: Optional[str] = None,
+    content_sha256: Optional[str] = None,
 ) -> None:
-    # You must set the `api_endpoint` if you use a location other than "us".
-    opts = ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
-
-    client = documentai.DocumentProcessorServiceClient(client_options=opts)
+    # Shared long-lived client for this location's endpoint
+    client = get_client(location)
 
     if processor_version_id:
         # The full resource name of the processor version, e.g.:
@@ -29,9 +48,8 @@ def process_document_sample(
         # `projects/{project_id}/locations/{location}/processors/{processor_id}`
         name = client.processor_path(project_id, location, processor_id)
 
-    # Read the file into memory
-    with open(file_path, "rb") as image:
-        image_content = image.read()
+    # Uploaded bytes are used as-is; paths are read into memory
+    image_content = read_document(document)
 
     # Load binary data
     raw_document = documentai.RawDocument(content=image_content, mime_type=mime_type)
@@ -53,11 +71,10 @@ def process_document_sample(
         process_options=process_options,
     )
 
-    result = client.process_document(request=request)
-
+    # Identical bytes sent to the same processor are served from the result cache
     # For a full list of `Document` object attributes, reference this page:
     # https://cloud.google.com/document-ai/docs/reference/rest/v1/Document
-    document = result.document
+    document = document_cache.process(client, request, content_sha256)
 
     # Read the text recognition output from the processor
     #print("The document contains the following text:")
@@ -65,14 +82,109 @@ def process_document_sample(
     return document.text
 
 
+def _page_cache_key(content_sha256: str, name: str, page_number: int) -> str:
+    return hashlib.sha256(f"{content_sha256}\0{name}\0page:{page_number}".encode("utf-8")).hexdigest()
+
+
+def _page_text(page: documentai.Document.Page, text: str) -> str:
+    return "".join(
+        text[int(segment.start_index) : int(segment.end_index)]
+        for segment in page.layout.text_anchor.text_segments
+    )
+
+
+def process_document_pages(
+    project_id: str,
+    location: str,
+    processor_id: str,
+    document: DocumentInput,
+    mime_type: str,
+    processor_version_id: Optional[str] = None,
+    content_sha256: Optional[str] = None,
+    shard_pages: int = OCR_SHARD_PAGES,
+) -> str:
+    """
+    OCR every page of a PDF. Pages are split into shards that fit the online
+    processing limit, shards run concurrently, and the text is merged back in
+    page order. Each page's text is cached, so only missing pages are sent.
+    Raises IncompleteOCRError when a shard's response lacks requested pages;
+    the pages that did come back stay cached for the retry.
+    """
+    client = get_client(location)
+    if processor_version_id:
+        name = client.processor_version_path(project_id, location, processor_id, processor_version_id)
+    else:
+        name = client.processor_path(project_id, location, processor_id)
+
+    image_content = read_document(document)
+    if content_sha256 is None:
+        content_sha256 = hashlib.sha256(image_content).hexdigest()
+
+    texts: Dict[int, str] = {}
+    missing: List[int] = []
+    for page_number in range(1, count_pdf_pages(image_content) + 1):
+        cached = document_cache.get(_page_cache_key(content_sha256, name, page_number))
+        if cached is not None:
+            texts[page_number] = cached.decode("utf-8")
+        else:
+            missing.append(page_number)
+
+    def process_shard(pages: List[int]) -> Dict[int, str]:
+        request = documentai.ProcessRequest(
+            name=name,
+            raw_document=documentai.RawDocument(content=image_content, mime_type=mime_type),
+            field_mask="text,pages.pageNumber,pages.layout",
+            process_options=documentai.ProcessOptions(
+                individual_page_selector=documentai.ProcessOptions.IndividualPageSelector(pages=pages)
+            ),
+        )
+        result = client.process_document(request=request).document
+        returned = {page.page_number: _page_text(page, result.text) for page in result.pages}
+        unexpected = sorted(set(returned) - set(pages))
+        if unexpected:
+            print(f"OCR returned pages {unexpected} that were not requested; ignoring them")
+        return {page_number: text for page_number, text in returned.items() if page_number in pages}
+
+    shards = [missing[i:i + shard_pages] for i in range(0, len(missing), shard_pages)]
+    # Every shard request carries the whole PDF
+    tracing.set_payload(len(image_content) * len(shards))
+    for shard_texts in _shard_executor.map(process_shard, shards):
+        for page_number, text in shard_texts.items():
+            texts[page_number] = text
+            document_cache.put(_page_cache_key(content_sha256, name, page_number), text.encode("utf-8"))
+
+    dropped = [page_number for page_number in missing if page_number not in texts]
+    if dropped:
+        print(f"OCR responses were missing pages {dropped} of {len(texts) + len(dropped)}")
+        raise IncompleteOCRError(f"Document AI returned no text for pages {dropped}")
+    return "".join(texts[page_number] for page_number in sorted(texts))
+
+
+def ocr_variant() -> str:
+    """Identifies what `ocr_processing` returns for a document: the processor and the pages it covers."""
+    return f"{OCR_PROCESSOR_ID}-{OCR_MODE}"
+
+
 # OCR with the processor
-def ocr_processing(temp_path):
+@tracing.traced("docai_ocr")
+def ocr_processing(document: DocumentInput, content_sha256: Optional[str] = None):
+    if OCR_MODE == "all_pages":
+        return process_document_pages(
+            project_id="genesis-genai-454505",
+            location="us",
+            processor_id=OCR_PROCESSOR_ID,
+            document=document,
+            mime_type="application/pdf",
+            content_sha256=content_sha256,
+        )
+
     text = process_document_sample(
         project_id="genesis-genai-454505",
         location="us",
-        processor_id="bad535317e51821f",
-        file_path=temp_path,
+        processor_id=OCR_PROCESSOR_ID,
+        document=document,
         mime_type="application/pdf",
+        content_sha256=content_sha256,
         field_mask="text",
     )
-    return text
\ No newline at end of file
+    return text
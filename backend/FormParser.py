@@ -1,21 +1,27 @@
 
 from typing import Optional, Sequence
 import json
-from google.api_core.client_options import ClientOptions
 from google.cloud import documentai
 
+from docai_cache import document_cache
+from docai_clients import get_client
+from documents import DocumentInput, read_document
+from tracing import traced
+
 
 def process_document_form_sample(
     project_id: str,
     location: str,
     processor_id: str,
     processor_version: str,
-    file_path: str,
+    document: DocumentInput,
     mime_type: str,
+    content_sha256: Optional[str] = None,
 ) -> dict:
     # Online processing request to Document AI
     document = process_document(
-        project_id, location, processor_id, processor_version, file_path, mime_type
+        project_id, location, processor_id, processor_version, document, mime_type,
+        content_sha256=content_sha256,
     )
 
     # Initialize dictionary to store form field key-value pairs
@@ -37,16 +43,13 @@ def process_document(
     location: str,
     processor_id: str,
     processor_version: str,
-    file_path: str,
+    document: DocumentInput,
     mime_type: str,
     process_options: Optional[documentai.ProcessOptions] = None,
+    content_sha256: Optional[str] = None,
 ) -> documentai.Document:
-    # You must set the `api_endpoint` if you use a location other than "us".
-    client = documentai.DocumentProcessorServiceClient(
-        client_options=ClientOptions(
-            api_endpoint=f"{location}-documentai.googleapis.com"
-        )
-    )
+    # Shared long-lived client for this location's endpoint
+    client = get_client(location)
 
     # The full resource name of the processor version, e.g.:
     # `projects/{project_id}/locations/{location}/processors/{processor_id}/processorVersions/{processor_version_id}`
@@ -55,9 +58,8 @@ def process_document(
         project_id, location, processor_id, processor_version
     )
 
-    # Read the file into memory
-    with open(file_path, "rb") as image:
-        image_content = image.read()
+    # Uploaded bytes are used as-is; paths are read into memory
+    image_content = read_document(document)
 
     # Configure the process request
     request = documentai.ProcessRequest(
@@ -67,11 +69,10 @@ def process_document(
         process_options=process_options,
     )
 
-    result = client.process_document(request=request)
-
+    # Identical bytes sent to the same processor are served from the result cache
     # For a full list of `Document` object attributes, reference this page:
     # https://cloud.google.com/document-ai/docs/reference/rest/v1/Document
-    return result.document
+    return document_cache.process(client, request, content_sha256)
 
 def layout_to_text(layout: documentai.Document.Page.Layout, text: str) -> str:
     """
@@ -87,13 +88,15 @@ def layout_to_text(layout: documentai.Document.Page.Layout, text: str) -> str:
     )
 
 # Example usage:
-def get_data(temp_path):
+@traced("docai_form_parse")
+def get_data(document: DocumentInput, content_sha256: Optional[str] = None):
     response = process_document_form_sample(
         project_id="genesis-genai-454505",
         location="us",
         processor_id="9c40568fce3ffba0",
-        file_path=temp_path,
+        document=document,
         mime_type="application/pdf",
-        processor_version="pretrained-form-parser-v2.1-2023-06-26"
+        processor_version="pretrained-form-parser-v2.1-2023-06-26",
+        content_sha256=content_sha256,
     )
     return response
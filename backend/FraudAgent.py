@@ -1,19 +1,17 @@
-import cohere
+import asyncio
 import numpy as np
-import json, os, regex as re
-from sklearn.metrics.pairwise import cosine_similarity
+import json, regex as re
 
-from dotenv import load_dotenv
+import cohere_clients
+import tracing
+from embedding_store import embedding_store
+from embedding_service import EmbeddingBatcher
+from llm_cache import llm_cache
 
-load_dotenv()
-co = cohere.Client(api_key=os.getenv("COHERE_API_KEY"))
 
-
-def analyze_claim_text(text: str) -> dict:
+async def analyze_claim_text(text: str) -> dict:
     """Improved JSON parsing with error handling"""
-    response = co.generate(
-        model="command",
-        prompt=f"""Analyze this insurance claim for fraud risk. Respond ONLY with valid JSON:
+    prompt = f"""Analyze this insurance claim for fraud risk. Respond ONLY with valid JSON:
         {{
             "fraud_risk": "low/medium/high",
             "reasons": ["list", "of", "reasons"],
@@ -22,13 +20,16 @@ def analyze_claim_text(text: str) -> dict:
         
         Claim: {text}
         
-        JSON:""",
-        temperature=0,
-        max_tokens=300
-    )
-    
+        JSON:"""
+    params = {"temperature": 0, "max_tokens": 300}
+
+    with tracing.trace("fraud_llm", payload_bytes=len(prompt.encode("utf-8"))):
+        raw_text = await llm_cache.acomplete(
+            "fraud_analysis", "command", prompt, params,
+            lambda: cohere_clients.generate("command", prompt, **params),
+        )
+
     # Extract JSON from response using regex
-    raw_text = response.generations[0].text
     json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
     
     if not json_match:
@@ -47,14 +48,34 @@ def analyze_claim_text(text: str) -> dict:
             "verification_needed": True
         }
 
-def get_embeddings(text: str) -> np.ndarray:
-    """Get document embeddings using Cohere's Embed API"""
-    response = co.embed(texts=[text], model="embed-english-v3.0", input_type="classification")
-    return np.array(response.embeddings[0])
+def _cohere_embed(texts, model, input_type):
+    # Runs on the batcher's sender threads, so it uses the shared sync client
+    return cohere_clients.get_client(1).embed(texts=texts, model=model, input_type=input_type).embeddings
+
+# Embed requests from concurrent claims are batched into shared Cohere calls
+embedding_batcher = EmbeddingBatcher(_cohere_embed)
+
+@tracing.traced("fraud_embed")
+def get_embeddings_batch(texts: list, model: str = "embed-english-v3.0", input_type: str = "classification") -> list:
+    """Get embeddings for several texts, reusing stored vectors and batching the rest"""
+    embeddings = [embedding_store.get(model, text, input_type) for text in texts]
+    futures = {
+        index: embedding_batcher.submit(text, model, input_type)
+        for index, text in enumerate(texts) if embeddings[index] is None
+    }
+    for index, future in futures.items():
+        embeddings[index] = future.result()
+        embedding_store.put(model, texts[index], embeddings[index], input_type)
+    return embeddings
+
+def get_embeddings(text: str, model: str = "embed-english-v3.0", input_type: str = "classification") -> np.ndarray:
+    """Get document embeddings using Cohere's Embed API, reusing stored vectors for seen texts"""
+    return get_embeddings_batch([text], model, input_type)[0]
 
 def calculate_similarity(vec1: np.ndarray, vec2: np.ndarray) -> float:
     """Calculate cosine similarity between two embeddings"""
-    return cosine_similarity([vec1], [vec2])[0][0]
+    norms = np.linalg.norm(vec1) * np.linalg.norm(vec2)
+    return float(np.dot(vec1, vec2) / norms) if norms else 0.0
 
 def concatenate_text_fields(claim_json: dict) -> str:
     """Concatenate all text fields in the claim_json dictionary"""
@@ -64,17 +85,16 @@ def concatenate_text_fields(claim_json: dict) -> str:
             text_fields.append(f"{key}: {value}")
     return "\n".join(text_fields)
 
-def assess_fraud(claim_json: dict, document_text: str) -> dict:
+async def assess_fraud(claim_json: dict, document_text: str) -> dict:
     """Main fraud assessment function"""
     # Concatenate all text fields for analysis
     claim_text = concatenate_text_fields(claim_json)
     
-    # Text analysis
-    text_analysis = analyze_claim_text(claim_text)
-    
-    # Embedding similarity check
-    claim_embed = get_embeddings(claim_text)
-    doc_embed = get_embeddings(document_text)
+    # Text analysis and the embedding similarity check run concurrently
+    text_analysis, (claim_embed, doc_embed) = await asyncio.gather(
+        analyze_claim_text(claim_text),
+        asyncio.to_thread(get_embeddings_batch, [claim_text, document_text]),
+    )
     similarity_score = calculate_similarity(claim_embed, doc_embed)
     
     return {
@@ -96,7 +116,7 @@ def assess_fraud(claim_json: dict, document_text: str) -> dict:
         "description": "Total loss of vintage 1965 Mustang in single-car collision. No police report available."
     }
 
-    result = assess_fraud(claim_data, insurance_doc)
+    result = asyncio.run(assess_fraud(claim_data, insurance_doc))
     
     print("\nFraud Analysis Results:")
     print(f"Text Analysis: {result['text_analysis']}")
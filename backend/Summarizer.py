@@ -1,12 +1,11 @@
-import cohere
-import os
-import json
-from dotenv import load_dotenv
+import cohere_clients
+import tracing
+from llm_cache import llm_cache
 
-load_dotenv()
-co = cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
+SUMMARY_MODEL = "command-r-plus-08-2024"
 
-def summarize(text):
+async def summarize_stream(text):
+    """Yield the summary text piece by piece as Cohere streams it."""
     prompt = f"""
     Below is a set of text data from insurance claim documents, including OCR-extracted text and structured data.
     Please generate a clear summary with the following sections (Keep each section to 3 sentences or shorter):
@@ -19,15 +18,18 @@ def summarize(text):
     Summary:
     """
 
-    response = co.chat_stream(
-        model="command-r-plus-08-2024",
-        messages=[{"role": "user", "content": prompt}],
-    )
+    messages = [{"role": "user", "content": prompt}]
 
-    
+    # Reprocessed claims replay the stored summary instead of calling Cohere again
+    with tracing.trace("summarize_llm", payload_bytes=len(prompt.encode("utf-8"))):
+        async for delta in llm_cache.astream(
+            "summarize", SUMMARY_MODEL, messages, None,
+            lambda: cohere_clients.chat_stream(SUMMARY_MODEL, messages),
+        ):
+            yield delta
+
+async def summarize(text):
     summary = ""
-    for event in response:
-        if event.type == "content-delta":
-            summary += event.delta.message.content.text
+    async for delta in summarize_stream(text):
+        summary += delta
     return summary
-
@@ -0,0 +1,137 @@
+import base64
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Iterable, Optional, Tuple
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# base64 characters decoded per step; a multiple of 4 so every slice decodes on its own
+DECODE_CHUNK_CHARS = 256 * 1024
+
+# Gmail issues a new attachmentId on every fetch, so message parts are keyed by
+# their stable MIME partId
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS message_parts (
+    message_id TEXT NOT NULL,
+    part_id TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    PRIMARY KEY (message_id, part_id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS claims (
+    claim_key TEXT PRIMARY KEY,
+    processed_at REAL NOT NULL
+);
+"""
+
+
+class AttachmentStore:
+    """
+    Content-addressed store for email attachments. Files live at
+    `<dir>/<sha[:2]>/<sha><ext>`, so identical attachments are kept once however
+    they were named, and an index records which message parts have been
+    downloaded and which claims (sets of files) have already been processed.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.directory, exist_ok=True)
+            conn = sqlite3.connect(
+                os.path.join(self.directory, "index.sqlite3"), check_same_thread=False, isolation_level=None
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def lookup(self, message_id: str, part_id: str) -> Optional[Tuple[str, str]]:
+        """`(path, sha256)` of a message part that was already downloaded, if its file still exists."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT blobs.path, blobs.sha256 FROM message_parts JOIN blobs USING (sha256) "
+                "WHERE message_id = ? AND part_id = ?",
+                (message_id, part_id),
+            ).fetchone()
+        if row is None or not os.path.exists(row[0]):
+            return None
+        return row[0], row[1]
+
+    def save_base64(self, message_id: str, part_id: str, filename: str, data: str) -> Tuple[str, str, bool]:
+        """
+        Decode Gmail's base64url attachment data to disk slice by slice, hashing as
+        it goes. Returns `(path, sha256, is_new)`; `is_new` is False when identical
+        content was already stored.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for start in range(0, len(data), DECODE_CHUNK_CHARS):
+                    piece = data[start:start + DECODE_CHUNK_CHARS]
+                    # Gmail omits padding, so only the final slice can need it
+                    chunk = base64.urlsafe_b64decode(piece + "=" * (-len(piece) % 4))
+                    digest.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+            extension = os.path.splitext(filename)[1].lower()
+            path = os.path.join(self.directory, sha256[:2], sha256 + extension)
+            is_new = not os.path.exists(path)
+            if is_new:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO blobs (sha256, path, size, created_at) VALUES (?, ?, ?, ?)",
+                (sha256, path, size, time.time()),
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO message_parts VALUES (?, ?, ?, ?)",
+                (message_id, part_id, sha256, filename),
+            )
+        return path, sha256, is_new
+
+    @staticmethod
+    def claim_key(hashes: Iterable[str]) -> str:
+        # Order and repeats don't matter: the same files make the same claim
+        return hashlib.sha256("\0".join(sorted(set(hashes))).encode("ascii")).hexdigest()
+
+    def is_claim_processed(self, hashes: Iterable[str]) -> bool:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM claims WHERE claim_key = ?", (self.claim_key(hashes),)
+            ).fetchone()
+        return row is not None
+
+    def mark_claim_processed(self, hashes: Iterable[str]) -> None:
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO claims VALUES (?, ?)", (self.claim_key(hashes), time.time())
+            )
+
+
+attachment_store = AttachmentStore(
+    os.getenv("ATTACHMENTS_DIR", os.path.join(CURRENT_DIR, "attachments"))
+)
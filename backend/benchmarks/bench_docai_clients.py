@@ -0,0 +1,78 @@
+"""
+Per-call overhead of building a Document AI client per request versus the
+shared clients in docai_clients, measured against a local fake gRPC server.
+
+Run from backend/:
+    python -m benchmarks.bench_docai_clients --calls 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import grpc
+from google.cloud import documentai  # type: ignore
+from google.cloud.documentai_v1.services.document_processor_service.transports import (
+    DocumentProcessorServiceGrpcTransport,
+)
+
+from benchmarks.fakes import FakeDocumentAIServer
+
+
+def make_request(client):
+    return documentai.ProcessRequest(
+        name=client.processor_path("bench-project", "us", "bench-processor"),
+        raw_document=documentai.RawDocument(content=b"%PDF-1.4 bench", mime_type="application/pdf"),
+    )
+
+
+def per_call_client(address):
+    # What the modules did before: a new client (and channel) for every document
+    channel = grpc.insecure_channel(address)
+    client = documentai.DocumentProcessorServiceClient(
+        transport=DocumentProcessorServiceGrpcTransport(channel=channel)
+    )
+    client.process_document(request=make_request(client))
+    client.transport.close()
+
+
+def report(label, samples):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{label:<22} mean={statistics.mean(samples) * 1000:8.3f} ms  "
+          f"p95={p95 * 1000:8.3f} ms  n={len(samples)}")
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with FakeDocumentAIServer() as server:
+        os.environ["DOCAI_API_ENDPOINT"] = server.address
+        os.environ["DOCAI_INSECURE"] = "1"
+        import docai_clients
+
+        fresh = []
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            per_call_client(server.address)
+            fresh.append(time.perf_counter() - start)
+
+        pooled = []
+        client = docai_clients.get_client("us")
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            docai_clients.get_client("us").process_document(request=make_request(client))
+            pooled.append(time.perf_counter() - start)
+        asyncio.run(docai_clients.close_clients())
+
+    fresh_mean = report("client per call", fresh)
+    pooled_mean = report("pooled sync client", pooled)
+    print(f"per-call overhead removed: {(fresh_mean - pooled_mean) * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Embed API calls and throughput for concurrent claims, each needing two
+embeddings, with one call per text versus the EmbeddingBatcher. The Cohere
+call is simulated with a fixed round trip plus a small per-text cost.
+
+Run from backend/:
+    python -m benchmarks.bench_embed_batching --claims 200 --concurrency 32
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from embedding_service import EmbeddingBatcher
+
+
+class FakeEmbedAPI:
+    def __init__(self, latency, per_text, dim=1024):
+        self.latency = latency
+        self.per_text = per_text
+        self.dim = dim
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, texts, model, input_type):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency + self.per_text * len(texts))
+        return [np.full(self.dim, hash(text) % 997, dtype=np.float32) for text in texts]
+
+
+def run(label, embed_pair, api, claims, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(embed_pair, range(claims)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<10} api_calls={api.calls:5d}  embeddings/s={claims * 2 / elapsed:8.1f}  "
+          f"wall={elapsed:6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--claims", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency", type=float, default=0.15, help="Seconds per embed call")
+    parser.add_argument("--per-text", type=float, default=0.002, help="Extra seconds per text")
+    parser.add_argument("--window-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    direct_api = FakeEmbedAPI(args.latency, args.per_text)
+
+    def direct(i):
+        # What assess_fraud did before: one call per text
+        direct_api([f"claim {i}"], "embed-english-v3.0", "classification")
+        direct_api([f"policy {i % 5}"], "embed-english-v3.0", "classification")
+
+    batched_api = FakeEmbedAPI(args.latency, args.per_text)
+    batcher = EmbeddingBatcher(batched_api, window=args.window_ms / 1000)
+
+    def batched(i):
+        texts = [f"claim {i}", f"policy {i % 5}"]
+        futures = [batcher.submit(text, "embed-english-v3.0", "classification") for text in texts]
+        for future in futures:
+            future.result()
+
+    run("direct", direct, direct_api, args.claims, args.concurrency)
+    run("batched", batched, batched_api, args.claims, args.concurrency)
+    print(batcher.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+End-to-end /upload latency and throughput without calling paid services. The
+backend runs in a subprocess against local stand-ins (benchmarks.fakes) for
+Document AI, Cohere chat/embed and Pinecone, each with configurable latency and
+jitter, replaying responses recorded from the sample PDFs. /upload is driven at
+each concurrency level, and p50/p95/p99 latency, requests per second and the
+server's peak RSS are written as JSON to compare between commits.
+
+With `--cache cold` (the default) every request is a distinct claim: the PDFs
+carry a per-request marker, so the Document AI, LLM and embedding caches miss.
+`--cache warm` resends identical claims and measures the cached path.
+
+Run from backend/:
+    python -m benchmarks.bench_end_to_end --concurrency 1 4 8 --output e2e.json
+    python -m benchmarks.bench_end_to_end --baseline e2e.json --tolerance 0.2
+Refresh benchmarks/recordings/ (real credentials; one claim through the real services):
+    python -m benchmarks.bench_end_to_end --record
+"""
+import argparse
+import json
+import math
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILES = ["sample.pdf", "sample1.pdf", "form1.pdf"]
+
+
+def serve(args):
+    """Backend process: main.app under uvicorn, with Pinecone swapped for the stand-in."""
+    import uvicorn
+
+    import main
+    import validate_formdata
+    from benchmarks.fakes import FakePinecone, PineconeRecorder
+
+    if args.record:
+        get_pinecone = validate_formdata.get_pinecone
+
+        def recording_pinecone():
+            pc, index = get_pinecone()
+            return pc, PineconeRecorder(index)
+
+        validate_formdata.get_pinecone = recording_pinecone
+    else:
+        pinecone = FakePinecone(args.pinecone_latency, args.pinecone_latency * args.jitter,
+                                policy_pdf=main.policy_path())
+        validate_formdata.get_pinecone = lambda: (pinecone, pinecone)
+    uvicorn.run(main.app, host="127.0.0.1", port=args.serve_port, log_level="warning")
+
+
+def backend_env(docai_address: str, cohere_url: str, cache_dir: str) -> dict:
+    """Environment for a backend process using the stand-ins and throwaway caches under `cache_dir`."""
+    return {
+        **os.environ,
+        "DOCAI_API_ENDPOINT": docai_address,
+        "DOCAI_INSECURE": "1",
+        "COHERE_BASE_URL": cohere_url,
+        "RETRIEVAL_BACKEND": "pinecone",
+        "DOCAI_CACHE_DIR": os.path.join(cache_dir, "documentai"),
+        "POLICY_CACHE_DIR": os.path.join(cache_dir, "policy"),
+        "LLM_CACHE_DB": os.path.join(cache_dir, "llm_cache.sqlite3"),
+        "EMBEDDING_STORE_DIR": os.path.join(cache_dir, "embeddings"),
+        "JOBS_DB": os.path.join(cache_dir, "jobs", "jobs.sqlite"),
+        "JOBS_FILES_DIR": os.path.join(cache_dir, "jobs", "files"),
+        "WARM_REMOTE_CLIENTS": "0",
+        "WARM_EMBEDDING_MODEL": "0",
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss(pid: int) -> None:
+    # Linux resets the VmHWM high-water mark when "5" is written to clear_refs
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of `samples`, which must be sorted."""
+    return samples[max(0, math.ceil(len(samples) * q) - 1)]
+
+
+def git_commit() -> Optional[str]:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=False)
+    return result.stdout.strip() or None
+
+
+def wait_until_ready(client, url, process, log_path, timeout=300.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+                raise SystemExit(f"backend exited during startup:\n{f.read()[-4000:]}")
+        try:
+            if client.get(f"{url}/metrics").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"backend not ready after {timeout:.0f}s")
+
+
+def post_claim(client, url, payloads: List[Tuple[str, bytes]], cold: bool):
+    from benchmarks.fakes import add_nonce
+
+    files = [("files", (name, add_nonce(data) if cold else data, "application/pdf")) for name, data in payloads]
+    return client.post(f"{url}/upload", params={"trace": "true"}, files=files)
+
+
+def run_level(client, url, payloads, concurrency: int, requests: int, cold: bool, pid: int) -> dict:
+    """Send `requests` claims from `concurrency` closed-loop workers."""
+    import httpx
+
+    remaining = iter(range(requests))
+    latencies: List[float] = []
+    stage_ms = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            start = time.perf_counter()
+            try:
+                response = post_claim(client, url, payloads, cold)
+                error = None if response.status_code == 200 else str(response.status_code)
+            except httpx.HTTPError as e:
+                error = type(e).__name__
+            elapsed = time.perf_counter() - start
+            with lock:
+                if error is not None:
+                    errors[error] += 1
+                    continue
+                latencies.append(elapsed)
+                for stage, total in response.json()["trace"]["by_stage"].items():
+                    stage_ms[stage].append(total["ms"])
+
+    reset_peak_rss(pid)
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    level = {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": dict(errors),
+        "seconds": round(seconds, 3),
+        "rps": round(len(latencies) / seconds, 3),
+        "latency_ms": None,
+        "stage_ms": {stage: round(statistics.mean(values), 1) for stage, values in sorted(stage_ms.items())},
+        "peak_rss_mb": peak_rss_mb(pid),
+    }
+    if latencies:
+        level["latency_ms"] = {
+            "p50": round(percentile(latencies, 0.50) * 1000, 1),
+            "p95": round(percentile(latencies, 0.95) * 1000, 1),
+            "p99": round(percentile(latencies, 0.99) * 1000, 1),
+            "mean": round(statistics.mean(latencies) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1),
+        }
+    return level
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    failures = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in result["levels"]:
+        base = baseline_levels.get(level["concurrency"])
+        if base is None or base["latency_ms"] is None or level["latency_ms"] is None:
+            continue
+        label = f"concurrency {level['concurrency']}"
+        for metric in ("p50", "p95", "p99"):
+            if level["latency_ms"][metric] > base["latency_ms"][metric] * (1 + tolerance):
+                failures.append(f"{label}: {metric} regressed to {level['latency_ms'][metric]} ms "
+                                f"(baseline {base['latency_ms'][metric]} ms)")
+        if level["rps"] < base["rps"] * (1 - tolerance):
+            failures.append(f"{label}: throughput fell to {level['rps']} rps (baseline {base['rps']} rps)")
+        if level["peak_rss_mb"] and base["peak_rss_mb"] and level["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            failures.append(f"{label}: peak RSS grew to {level['peak_rss_mb']} MB (baseline {base['peak_rss_mb']} MB)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="+", default=SAMPLE_FILES, help="PDFs sent together as one claim")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=24, help="Claims per concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured claims sent before the first level")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold")
+    parser.add_argument("--docai-latency", type=float, default=1.0, help="Seconds per Document AI call")
+    parser.add_argument("--cohere-latency", type=float, default=1.5,
+                        help="Seconds per completion, or before the first streamed token")
+    parser.add_argument("--cohere-token-ms", type=float, default=10, help="Delay between streamed words")
+    parser.add_argument("--embed-latency", type=float, default=0.15, help="Seconds per Cohere embed call")
+    parser.add_argument("--pinecone-latency", type=float, default=0.1, help="Seconds per Pinecone call")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- fraction applied to every latency")
+    parser.add_argument("--record", action="store_true",
+                        help="Forward one claim to the real services and save their responses as recordings")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression over the baseline")
+    parser.add_argument("--output", help="Write the results here as JSON")
+    parser.add_argument("--serve-port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_port is not None:
+        return serve(args)
+
+    import httpx
+
+    from benchmarks.fakes import FakeCohereServer, ReplayDocumentAIServer
+
+    if args.record:
+        args.concurrency, args.requests, args.warmup, args.cache = [1], 1, 0, "warm"
+
+    payloads = []
+    for name in args.files:
+        with open(os.path.join(BACKEND_DIR, name) if not os.path.isabs(name) else name, "rb") as f:
+            payloads.append((os.path.basename(name), f.read()))
+
+    docai = ReplayDocumentAIServer(
+        latency=args.docai_latency, jitter=args.docai_latency * args.jitter, record=args.record
+    )
+    cohere = FakeCohereServer(
+        latency=args.cohere_latency, jitter=args.cohere_latency * args.jitter, embed_latency=args.embed_latency,
+        token_delay=args.cohere_token_ms / 1000, record=args.record,
+    )
+    with docai, cohere, tempfile.TemporaryDirectory() as cache_dir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        env = backend_env(docai.address, cohere.url, cache_dir)
+        if not args.record:
+            env["COHERE_API_KEY"] = "bench"
+        command = [
+            sys.executable, "-m", "benchmarks.bench_end_to_end", "--serve-port", str(port),
+            "--pinecone-latency", str(args.pinecone_latency), "--jitter", str(args.jitter),
+        ] + (["--record"] if args.record else [])
+
+        log_path = os.path.join(cache_dir, "server.log")
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            limits = httpx.Limits(max_connections=max(args.concurrency))
+            with httpx.Client(timeout=httpx.Timeout(600.0), limits=limits) as client:
+                wait_until_ready(client, url, process, log_path)
+                for _ in range(args.warmup):
+                    post_claim(client, url, payloads, args.cache == "cold").raise_for_status()
+                levels = []
+                for concurrency in args.concurrency:
+                    level = run_level(client, url, payloads, concurrency, max(args.requests, concurrency),
+                                      args.cache == "cold", process.pid)
+                    levels.append(level)
+                    latency = level["latency_ms"] or {}
+                    print(f"concurrency {concurrency:>3}: {level['rps']:7.3f} rps  "
+                          f"p50={latency.get('p50')} ms  p95={latency.get('p95')} ms  p99={latency.get('p99')} ms  "
+                          f"peak RSS={level['peak_rss_mb']} MB  errors={sum(level['errors'].values())}",
+                          file=sys.stderr)
+                cache_stats = client.get(f"{url}/cache/stats").json()
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    result = {
+        "commit": git_commit(),
+        "files": [name for name, _ in payloads],
+        "cache": args.cache,
+        "latency_seconds": {
+            "docai": args.docai_latency,
+            "cohere": args.cohere_latency,
+            "cohere_token": args.cohere_token_ms / 1000,
+            "embed": args.embed_latency,
+            "pinecone": args.pinecone_latency,
+            "jitter": args.jitter,
+        },
+        "levels": levels,
+        "peak_rss_mb": max((level["peak_rss_mb"] or 0 for level in levels), default=None),
+        "fake_calls": {
+            "documentai": docai.calls,
+            "documentai_replayed": docai.replayed,
+            "documentai_derived": docai.derived,
+            "cohere": cohere.calls,
+        },
+        "cache_stats": cache_stats,
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failures = [
+        f"concurrency {level['concurrency']}: {sum(level['errors'].values())} failed requests {level['errors']}"
+        for level in levels if level["errors"]
+    ]
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            failures += compare(result, json.load(f), args.tolerance)
+    if failures:
+        raise SystemExit("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
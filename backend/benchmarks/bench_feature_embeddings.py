@@ -0,0 +1,58 @@
+"""
+CPU time of feature_embeddings: the old path (new SentenceTransformer per call,
+one encode per chunk, lists of floats) versus the warm, batched float32 path.
+
+Run from backend/:
+    python -m benchmarks.bench_feature_embeddings --chunks 500 --calls 3
+"""
+import argparse
+import time
+
+from sentence_transformers import SentenceTransformer
+
+import feature_embeddings
+
+
+def legacy_get_embeddings(data, model_name='all-MiniLM-L6-v2', split_by='\n'):
+    embedding_model = SentenceTransformer(model_name)
+    text_chunks = data.split(split_by)
+    embeddings = [embedding_model.encode(chunk).tolist() for chunk in text_chunks]
+    return [{"id": idx, "embedding": embedding} for idx, embedding in enumerate(embeddings)]
+
+
+def timed(fn, calls):
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls, (time.process_time() - cpu_start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--calls", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    data = "\n".join(
+        f"Line {i}: patient reports lower back pain, outpatient physiotherapy session {i % 12}"
+        for i in range(args.chunks)
+    )
+
+    legacy_wall, legacy_cpu = timed(lambda: legacy_get_embeddings(data), args.calls)
+    warm_start = time.perf_counter()
+    feature_embeddings.warm_up()
+    warm_cost = time.perf_counter() - warm_start
+    new_wall, new_cpu = timed(
+        lambda: feature_embeddings.get_embeddings(data, batch_size=args.batch_size), args.calls
+    )
+
+    print(f"{args.chunks} chunks per call, {args.calls} calls")
+    print(f"legacy   wall={legacy_wall:7.3f}s  cpu={legacy_cpu:7.3f}s  per call")
+    print(f"batched  wall={new_wall:7.3f}s  cpu={new_cpu:7.3f}s  per call  (one-time warm-up {warm_cost:.3f}s)")
+    print(f"speedup  {legacy_wall / new_wall:.1f}x wall")
+
+
+if __name__ == "__main__":
+    main()
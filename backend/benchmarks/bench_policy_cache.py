@@ -0,0 +1,72 @@
+"""
+Per-request latency of loading the policy text, with and without policy_cache.
+
+Run from backend/:
+    python -m benchmarks.bench_policy_cache --requests 20 --ocr-latency 1.5
+    python -m benchmarks.bench_policy_cache --live   # real Document AI OCR
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+import policy_cache
+from DocumentAIProcessor import ocr_processing
+
+
+def fake_ocr(latency):
+    def ocr(path):
+        time.sleep(latency)
+        return f"policy text for {os.path.basename(path)}"
+    return ocr
+
+
+def timed(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<28} mean={statistics.mean(samples) * 1000:9.2f} ms  "
+          f"max={max(samples) * 1000:9.2f} ms  n={len(samples)}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--ocr-latency", type=float, default=1.5,
+                        help="Simulated Document AI round trip in seconds")
+    parser.add_argument("--live", action="store_true", help="Use the real OCR processor")
+    args = parser.parse_args()
+
+    ocr = ocr_processing if args.live else fake_ocr(args.ocr_latency)
+    path = policy_cache.POLICY_PATH
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        policy_cache.CACHE_DIR = cache_dir
+
+        uncached = timed(lambda: ocr(path), min(args.requests, 3) if args.live else args.requests)
+        cold = timed(lambda: policy_cache.get_policy_text(path, ocr), 1)
+        warm = timed(lambda: policy_cache.get_policy_text(path, ocr), args.requests)
+
+        def disk_hit():
+            # Simulates a restarted worker: memory is empty, the disk entry survives
+            policy_cache._texts.clear()
+            policy_cache.get_policy_text(path, ocr)
+        disk = timed(disk_hit, args.requests)
+
+    report("uncached (OCR per request)", uncached)
+    report("cache cold (first request)", cold)
+    report("cache memory hit", warm)
+    report("cache disk hit (new worker)", disk)
+    saved = statistics.mean(uncached) - statistics.mean(warm)
+    print(f"latency saved per request: {saved * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
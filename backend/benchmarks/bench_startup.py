@@ -0,0 +1,112 @@
+"""
+Import time and resident memory of `import main`, measured in fresh
+interpreters, plus the heavy dependencies the import pulled in and the
+slowest modules by cumulative import time. Fails when a budget is exceeded or
+when a run regresses past a saved baseline.
+
+Run from backend/:
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dependencies that should only load on first use or during an enabled warm-up
+HEAVY_MODULES = ["sentence_transformers", "torch", "sklearn", "langchain", "langchain_cohere", "pinecone", "cohere"]
+
+_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+with open("/proc/self/statm") as f:
+    rss_pages = int(f.read().split()[1])
+print(json.dumps({
+    "seconds": seconds,
+    "rss_mb": rss_pages * resource.getpagesize() / 2**20,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    "loaded": sorted(name for name in HEAVY if name in sys.modules),
+}))
+"""
+
+
+def probe(env):
+    code = f"HEAVY = {HEAVY_MODULES!r}\n{_PROBE}"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def slowest_imports(env, top):
+    """Top modules by cumulative import time, from `python -X importtime`."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            rows.append({"module": match.group(4), "cumulative_ms": int(match.group(2)) / 1000,
+                         "depth": (len(match.group(3)) - 1) // 2})
+    # Only top-level imports of each subtree, so parents and children aren't double listed
+    rows = [row for row in rows if row["depth"] <= 1]
+    return sorted(rows, key=lambda row: -row["cumulative_ms"])[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports to report")
+    parser.add_argument("--max-seconds", type=float, help="Fail if median import time exceeds this")
+    parser.add_argument("--max-rss-mb", type=float, help="Fail if median RSS after import exceeds this")
+    parser.add_argument("--baseline", help="JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed regression over the baseline")
+    parser.add_argument("--output", help="Write the results here as JSON")
+    args = parser.parse_args()
+
+    # Warm-ups are startup events, not import side effects; keep them off regardless
+    env = {**os.environ, "WARM_POLICY_CACHE": "0", "WARM_REMOTE_CLIENTS": "0", "WARM_EMBEDDING_MODEL": "0"}
+    runs = [probe(env) for _ in range(args.runs)]
+    result = {
+        "runs": args.runs,
+        "import_seconds": round(statistics.median(run["seconds"] for run in runs), 4),
+        "import_seconds_min": round(min(run["seconds"] for run in runs), 4),
+        "rss_mb": round(statistics.median(run["rss_mb"] for run in runs), 1),
+        "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+        "heavy_modules_loaded": runs[-1]["loaded"],
+        "slowest_imports": slowest_imports(env, args.top),
+    }
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if args.max_seconds is not None and result["import_seconds"] > args.max_seconds:
+        failures.append(f"import took {result['import_seconds']}s (budget {args.max_seconds}s)")
+    if args.max_rss_mb is not None and result["rss_mb"] > args.max_rss_mb:
+        failures.append(f"RSS after import is {result['rss_mb']} MB (budget {args.max_rss_mb} MB)")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        for metric in ("import_seconds", "rss_mb"):
+            limit = baseline[metric] * (1 + args.tolerance)
+            if result[metric] > limit:
+                failures.append(f"{metric} regressed: {result[metric]} vs baseline {baseline[metric]}")
+        for name in set(result["heavy_modules_loaded"]) - set(baseline["heavy_modules_loaded"]):
+            failures.append(f"{name} is now imported at startup")
+    if failures:
+        raise SystemExit("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+/upload wall time versus number of files, against a fake Document AI server
+that injects latency on every call. With concurrent per-file processing,
+N files (N <= DOCAI_CONCURRENCY) should take roughly the time of one.
+
+Run from backend/:
+    python -m benchmarks.bench_upload_concurrency --latency 0.5 --files 1 4 8
+"""
+import argparse
+import os
+import tempfile
+import time
+import uuid
+
+from benchmarks.fakes import FakeDocumentAIServer
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds per Document AI call")
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="Fail if N files take longer than this multiple of one file")
+    args = parser.parse_args()
+
+    with FakeDocumentAIServer(latency=args.latency) as server, tempfile.TemporaryDirectory() as cache_dir:
+        os.environ.update({
+            "DOCAI_API_ENDPOINT": server.address,
+            "DOCAI_INSECURE": "1",
+            "DOCAI_CACHE_DIR": os.path.join(cache_dir, "documentai"),
+            "POLICY_CACHE_DIR": os.path.join(cache_dir, "policy"),
+            "LLM_CACHE_DB": os.path.join(cache_dir, "llm_cache.sqlite3"),
+            "EMBEDDING_STORE_DIR": os.path.join(cache_dir, "embeddings"),
+            "JOBS_DB": os.path.join(cache_dir, "jobs", "jobs.sqlite"),
+            "JOBS_FILES_DIR": os.path.join(cache_dir, "jobs", "files"),
+            "WARM_POLICY_CACHE": "0",
+        })
+        from fastapi.testclient import TestClient
+        import main as backend
+
+        # Only the document stage is measured; the LLM summary is not part of this benchmark
+        backend.summarize = lambda text: ""
+
+        def upload(n):
+            # Unique bytes per file so the Document AI result cache never hits
+            files = [("files", (f"doc{i}.pdf", f"%PDF-1.4 {uuid.uuid4()}".encode(), "application/pdf"))
+                     for i in range(n)]
+            start = time.perf_counter()
+            response = client.post("/upload", files=files)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        with TestClient(backend.app) as client:
+            upload(1)  # fills the policy cache
+            timings = {n: upload(n) for n in args.files}
+
+    baseline = timings[min(timings)]
+    print(f"latency per Document AI call: {args.latency:.2f}s, "
+          f"concurrency cap: {backend.DOCAI_CONCURRENCY}")
+    ok = True
+    for n, elapsed in timings.items():
+        ratio = elapsed / baseline
+        print(f"{n:>3} files: {elapsed:6.2f}s  ({ratio:4.2f}x one file)")
+        if n <= backend.DOCAI_CONCURRENCY and ratio > args.tolerance:
+            ok = False
+    if not ok:
+        raise SystemExit("upload latency grew with file count below the concurrency cap")
+
+
+if __name__ == "__main__":
+    main()
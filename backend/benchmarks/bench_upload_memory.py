@@ -0,0 +1,165 @@
+"""
+Server memory for large claims on the real /upload endpoint. The backend runs
+under uvicorn against the local Document AI and Cohere stand-ins (see
+bench_end_to_end), claims of padded sample PDFs are posted, and the server's
+RSS high-water mark above its idle RSS is reported per file size and
+concurrency. A claim over the per-request cap must be refused with 413.
+
+Run from backend/:
+    python -m benchmarks.bench_upload_memory --file-mb 1 5 20 --concurrency 1 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import List, Optional, Tuple
+
+from benchmarks.bench_end_to_end import (
+    BACKEND_DIR, SAMPLE_FILES, backend_env, free_port, peak_rss_mb, reset_peak_rss, wait_until_ready,
+)
+
+
+def current_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def padded(content: bytes, size: int) -> bytes:
+    """The PDF followed by comment lines of incompressible filler, `size` bytes in total."""
+    filler = bytearray()
+    while len(content) + len(filler) < size:
+        filler += b"%" + os.urandom(32).hex().encode() + b"\n"
+    return content + bytes(filler[:max(0, size - len(content))])
+
+
+def post_claim(client, url, payloads: List[Tuple[str, bytes]]):
+    from benchmarks.fakes import add_nonce
+
+    files = [("files", (name, add_nonce(data), "application/pdf")) for name, data in payloads]
+    return client.post(f"{url}/upload", files=files)
+
+
+def measure(client, url, payloads, concurrency: int, pid: int) -> dict:
+    """Send `concurrency` claims at once and report the server's RSS growth over idle."""
+    statuses = []
+    lock = threading.Lock()
+
+    def worker():
+        status = post_claim(client, url, payloads).status_code
+        with lock:
+            statuses.append(status)
+
+    idle = current_rss_mb(pid)
+    reset_peak_rss(pid)
+    workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    peak = peak_rss_mb(pid)
+
+    claim_mb = sum(len(data) for _, data in payloads) / 1024 / 1024
+    growth = round(peak - idle, 1) if peak is not None and idle is not None else None
+    return {
+        "concurrency": concurrency,
+        "claim_mb": round(claim_mb, 1),
+        "idle_rss_mb": idle,
+        "peak_rss_mb": peak,
+        "growth_mb": growth,
+        "growth_per_claim_mb": round(growth / concurrency, 1) if growth is not None else None,
+        "statuses": sorted(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", nargs="+", default=SAMPLE_FILES, help="PDFs sent together as one claim")
+    parser.add_argument("--file-mb", type=float, nargs="+", default=[1, 5, 20], help="Padded size of each PDF")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--max-upload-mb", type=float, default=25, help="MAX_UPLOAD_MB for the server")
+    parser.add_argument("--max-request-mb", type=float, default=60, help="MAX_REQUEST_MB for the server")
+    parser.add_argument("--output", help="Write the results here as JSON")
+    args = parser.parse_args()
+
+    import httpx
+
+    from benchmarks.fakes import FakeCohereServer, ReplayDocumentAIServer
+
+    samples = []
+    for name in args.files:
+        with open(os.path.join(BACKEND_DIR, name) if not os.path.isabs(name) else name, "rb") as f:
+            samples.append((os.path.basename(name), f.read()))
+
+    with ReplayDocumentAIServer() as docai, FakeCohereServer() as cohere, \
+            tempfile.TemporaryDirectory() as cache_dir:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        env = backend_env(docai.address, cohere.url, cache_dir)
+        env.update({
+            "COHERE_API_KEY": "bench",
+            "MAX_UPLOAD_MB": str(args.max_upload_mb),
+            "MAX_REQUEST_MB": str(args.max_request_mb),
+        })
+        command = [
+            sys.executable, "-m", "benchmarks.bench_end_to_end", "--serve-port", str(port),
+            "--pinecone-latency", "0", "--jitter", "0",
+        ]
+        log_path = os.path.join(cache_dir, "server.log")
+        with open(log_path, "w") as log:
+            process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            with httpx.Client(timeout=httpx.Timeout(600.0)) as client:
+                wait_until_ready(client, url, process, log_path)
+                post_claim(client, url, samples).raise_for_status()
+
+                levels = []
+                for file_mb in args.file_mb:
+                    size = int(file_mb * 1024 * 1024)
+                    payloads = [(name, padded(data, size)) for name, data in samples]
+                    if sum(len(data) for _, data in payloads) > args.max_request_mb * 1024 * 1024 \
+                            or size > args.max_upload_mb * 1024 * 1024:
+                        print(f"{file_mb} MB files: over the request cap, skipped", file=sys.stderr)
+                        continue
+                    for concurrency in args.concurrency:
+                        level = {"file_mb": file_mb, **measure(client, url, payloads, concurrency, process.pid)}
+                        levels.append(level)
+                        print(f"{file_mb:>6} MB x {len(payloads)} files, concurrency {concurrency:>2}: "
+                              f"idle={level['idle_rss_mb']} MB  peak={level['peak_rss_mb']} MB  "
+                              f"growth/claim={level['growth_per_claim_mb']} MB "
+                              f"({level['claim_mb']} MB claim)  statuses={level['statuses']}", file=sys.stderr)
+
+                # Over the per-request total, with every file within the per-file cap
+                file_size = int(min(args.max_upload_mb, args.max_request_mb) * 1024 * 1024)
+                count = int(args.max_request_mb * 1024 * 1024 // file_size) + 1
+                over = [(name, padded(data, file_size))
+                        for name, data in (samples[i % len(samples)] for i in range(count))]
+                over_cap_status = post_claim(client, url, over).status_code
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+
+    result = {"levels": levels, "over_cap_status": over_cap_status}
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    failures = [f"{level['file_mb']} MB at concurrency {level['concurrency']}: statuses {level['statuses']}"
+                for level in levels if any(status != 200 for status in level["statuses"])]
+    if over_cap_status != 413:
+        failures.append(f"over-cap claim returned {over_cap_status}, expected 413")
+    if failures:
+        raise SystemExit("; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
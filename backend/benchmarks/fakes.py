@@ -0,0 +1,498 @@
+"""Local stand-ins for the external services the backend calls."""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.request
+import uuid
+from concurrent import futures
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+import grpc
+import numpy as np
+from google.cloud import documentai  # type: ignore
+
+from documents import count_pdf_pages, inflate_streams
+
+DOCAI_SERVICE = "google.cloud.documentai.v1.DocumentProcessorService"
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+# Appended to uploaded PDFs so each request is a distinct claim; stripped again by the fakes
+_NONCE_RE = re.compile(rb"\n%bench-request ([0-9a-f]+)\n$")
+
+
+def sleep_with_jitter(latency: float, jitter: float) -> None:
+    delay = latency + random.uniform(-jitter, jitter)
+    if delay > 0:
+        time.sleep(delay)
+
+
+def add_nonce(content: bytes) -> bytes:
+    return content + f"\n%bench-request {uuid.uuid4().hex}\n".encode()
+
+
+def split_nonce(content: bytes) -> Tuple[bytes, Optional[str]]:
+    match = _NONCE_RE.search(content)
+    if match is None:
+        return content, None
+    return content[:match.start()], match.group(1).decode()
+
+
+def pdf_text(content: bytes) -> str:
+    """The PDF's text layer, read from its Tj/TJ operators, as a rough stand-in for OCR output."""
+    pieces = []
+    for data in inflate_streams(content):
+        for match in re.finditer(rb"\[(.*?)\]\s*TJ|\(((?:\\.|[^\\)])*)\)\s*Tj", data, re.S):
+            if match.group(1) is not None:
+                pieces.append(b"".join(re.findall(rb"\(((?:\\.|[^\\)])*)\)", match.group(1))))
+            else:
+                pieces.append(match.group(2))
+    text = b" ".join(pieces).decode("latin-1")
+    return re.sub(r"\\(.)", r"\1", " ".join(text.split()))
+
+
+def pdf_form_fields(content: bytes) -> List[Tuple[str, str]]:
+    """(name, value) pairs of the filled-in AcroForm fields."""
+    fields = []
+    for obj in re.findall(rb"\sobj\b(.*?)\bendobj", content, re.S):
+        name = re.search(rb"/T\s*\(([^)]*)\)", obj)
+        value = re.search(rb"/V\s*\(([^)]*)\)", obj)
+        if name and value:
+            fields.append((name.group(1).decode("latin-1"), value.group(1).decode("latin-1")))
+    return fields
+
+
+def _layout(start: int, end: int) -> documentai.Document.Page.Layout:
+    segment = documentai.Document.TextAnchor.TextSegment(start_index=start, end_index=end)
+    return documentai.Document.Page.Layout(text_anchor=documentai.Document.TextAnchor(text_segments=[segment]))
+
+
+def derived_document(content: bytes, pages: Optional[List[int]] = None) -> documentai.Document:
+    """
+    A Document AI response built from the PDF itself: its text layer as OCR text
+    split across the requested pages, its filled form fields as form parser
+    output, and a classifier entity. One response serves all three processors.
+    """
+    page_count = count_pdf_pages(content)
+    pages = pages or list(range(1, page_count + 1))
+    layer = pdf_text(content)
+    per_page = -(-len(layer) // page_count) if layer else 0
+    text = "".join(layer[(page - 1) * per_page:page * per_page] for page in pages)
+
+    document_pages = []
+    for i, page in enumerate(pages):
+        start = min(i * per_page, len(text))
+        document_pages.append(documentai.Document.Page(
+            page_number=page, layout=_layout(start, min(start + per_page, len(text)))
+        ))
+
+    fields = pdf_form_fields(content)
+    form_fields = []
+    for name, value in fields:
+        text += "\n"
+        name_start = len(text)
+        text += f"{name}: "
+        value_start = len(text)
+        text += value
+        form_fields.append(documentai.Document.Page.FormField(
+            field_name=_layout(name_start, value_start - 2), field_value=_layout(value_start, len(text))
+        ))
+    if document_pages:
+        document_pages[0].form_fields = form_fields
+
+    return documentai.Document(
+        text=text,
+        pages=document_pages,
+        entities=[documentai.Document.Entity(type_="form" if fields else "written_notes", confidence=0.9)],
+    )
+
+
+def _with_reference(document: documentai.Document, nonce: str) -> documentai.Document:
+    """Tag the response with the request's nonce so downstream prompts differ per claim."""
+    start = len(document.text) + 1
+    document.text += f"\nReference: {nonce}"
+    if document.pages:
+        document.pages[-1].layout.text_anchor.text_segments.append(
+            documentai.Document.TextAnchor.TextSegment(start_index=start, end_index=len(document.text))
+        )
+        document.pages[0].form_fields.append(documentai.Document.Page.FormField(
+            field_name=_layout(start, start + len("Reference")), field_value=_layout(start + 11, len(document.text))
+        ))
+    return document
+
+
+class FakeDocumentAIServer:
+    """
+    In-process gRPC server speaking the Document AI `ProcessDocument` RPC.
+
+    Point the backend at it with DOCAI_API_ENDPOINT=<address> and DOCAI_INSECURE=1.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, port: int = 0, max_workers: int = 32,
+                 max_message_mb: int = 64):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        # gRPC's 4 MB default would reject the large uploads the real API accepts
+        self._server = grpc.server(
+            futures.ThreadPoolExecutor(max_workers=max_workers),
+            options=[("grpc.max_receive_message_length", max_message_mb * 1024 * 1024)],
+        )
+        handler = grpc.method_handlers_generic_handler(DOCAI_SERVICE, {
+            "ProcessDocument": grpc.unary_unary_rpc_method_handler(
+                self._process_document,
+                request_deserializer=documentai.ProcessRequest.deserialize,
+                response_serializer=documentai.ProcessResponse.serialize,
+            ),
+        })
+        self._server.add_generic_rpc_handlers((handler,))
+        self.port = self._server.add_insecure_port(f"127.0.0.1:{port}")
+        self.address = f"127.0.0.1:{self.port}"
+
+    def respond(self, request: documentai.ProcessRequest) -> documentai.Document:
+        # Minimal document that satisfies the classifier, form parser and OCR paths
+        return documentai.Document(
+            text=f"fake document ({len(request.raw_document.content)} bytes)",
+            entities=[documentai.Document.Entity(type_="written_notes", confidence=0.9)],
+        )
+
+    def _process_document(self, request, context):
+        self.calls += 1
+        sleep_with_jitter(self.latency, self.jitter)
+        return documentai.ProcessResponse(document=self.respond(request))
+
+    def start(self) -> "FakeDocumentAIServer":
+        self._server.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.stop(grace=None)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class ReplayDocumentAIServer(FakeDocumentAIServer):
+    """
+    Fake Document AI that replays responses recorded per processor and document
+    (`<processor>-<sha256 prefix>.json` under `recordings_dir`), falling back to
+    `derived_document` for documents without a recording. With `record=True`
+    every call is forwarded to the real API and its response saved.
+    """
+
+    def __init__(self, recordings_dir: str = os.path.join(RECORDINGS_DIR, "documentai"),
+                 record: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.recordings_dir = recordings_dir
+        self.record = record
+        self.replayed = 0
+        self.derived = 0
+        self._documents: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def _recording_path(self, request: documentai.ProcessRequest, content: bytes) -> str:
+        processor = re.search(r"processors/([^/]+)", request.name).group(1)
+        return os.path.join(self.recordings_dir, f"{processor}-{hashlib.sha256(content).hexdigest()[:16]}.json")
+
+    def _forward(self, request: documentai.ProcessRequest) -> documentai.Document:
+        from google.api_core.client_options import ClientOptions
+
+        location = re.search(r"locations/([^/]+)", request.name).group(1)
+        client = documentai.DocumentProcessorServiceClient(
+            client_options=ClientOptions(api_endpoint=f"{location}-documentai.googleapis.com")
+        )
+        return client.process_document(request=request).document
+
+    def respond(self, request: documentai.ProcessRequest) -> documentai.Document:
+        content, nonce = split_nonce(request.raw_document.content)
+        path = self._recording_path(request, content)
+        if self.record:
+            request.raw_document.content = content
+            document = self._forward(request)
+            os.makedirs(self.recordings_dir, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(documentai.Document.to_json(document))
+            return document
+
+        recorded = os.path.exists(path)
+        pages = list(request.process_options.individual_page_selector.pages)
+        key = f"{path}:{pages}"
+        with self._lock:
+            if recorded:
+                self.replayed += 1
+            else:
+                self.derived += 1
+            data = self._documents.get(key)
+        if data is None:
+            if recorded:
+                with open(path, "r", encoding="utf-8") as f:
+                    document = documentai.Document.from_json(f.read(), ignore_unknown_fields=True)
+            else:
+                document = derived_document(content, pages)
+            data = documentai.Document.serialize(document)
+            with self._lock:
+                self._documents[key] = data
+
+        document = documentai.Document.deserialize(data)
+        return _with_reference(document, nonce) if nonce else document
+
+
+DEFAULT_COHERE_RESPONSES = {
+    "summary": (
+        "1. Patient Background: The patient is an adult policyholder with no significant medical history "
+        "noted in the submitted documents. Their occupation is not stated.\n"
+        "2. Reason for the Claim: The claim covers outpatient treatment billed by the listed provider, "
+        "with the service dates and charges shown on the claim form.\n"
+        "3. Additional Background: No dependents or financial details are included in the documents."
+    ),
+    "validation": (
+        "**1.** ✅ Yes - The policy number is present and well-formed.\n"
+        "**2.** 🤔 Cannot determine - The policy dates are not included in the uploaded data.\n"
+        "**3.** 🤔 Cannot determine - No diagnosis code was provided.\n"
+        "**4.** ✅ Yes - The charges are within the policy limits.\n"
+        "**5.** ✅ Yes - Outpatient treatment is covered.\n"
+        "**6.** ✅ Yes - Nothing unusual stands out.\n\n"
+        "**FLAG** - The claim looks consistent, but the missing dates and diagnosis should be confirmed "
+        "before approval."
+    ),
+    "fraud": '{"fraud_risk": "low", "reasons": ["Details are internally consistent"], "verification_needed": false}',
+}
+
+
+class FakeCohereServer:
+    """
+    HTTP stand-in for the Cohere endpoints the backend uses: v2 chat (plain and
+    streamed), v1 generate and v1 embed. Point the backend at it with
+    COHERE_BASE_URL=<url>.
+
+    Completions replay the texts in `recordings_dir/cohere.json` (keyed summary,
+    validation and fraud) or built-in defaults. Streams wait `latency` before
+    the first token and `token_delay` between words. Embeddings are unit vectors
+    seeded by the text's hash, so equal texts get equal vectors. With
+    `record=True`, calls are forwarded to the real API and completions saved.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, embed_latency: Optional[float] = None,
+                 token_delay: float = 0.0, dim: int = 1024, recordings_dir: str = RECORDINGS_DIR,
+                 record: bool = False, upstream: str = "https://api.cohere.com"):
+        self.latency = latency
+        self.jitter = jitter
+        self.embed_latency = latency if embed_latency is None else embed_latency
+        self.token_delay = token_delay
+        self.dim = dim
+        self.record = record
+        self.upstream = upstream
+        self.recordings_path = os.path.join(recordings_dir, "cohere.json")
+        self.responses = dict(DEFAULT_COHERE_RESPONSES)
+        if os.path.exists(self.recordings_path):
+            with open(self.recordings_path, "r", encoding="utf-8") as f:
+                self.responses.update(json.load(f))
+        self.calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fake._handle(self, body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _kind(path: str, body: dict) -> str:
+        if path.endswith("/embed"):
+            return "embed"
+        if path.endswith("/generate"):
+            return "fraud"
+        prompt = " ".join(str(message.get("content", "")) for message in body.get("messages", []))
+        return "summary" if "Summary:" in prompt else "validation"
+
+    def _forward(self, handler: BaseHTTPRequestHandler, body: dict) -> dict:
+        request = urllib.request.Request(
+            self.upstream + handler.path,
+            data=json.dumps({**body, "stream": False}).encode(),
+            headers={"Content-Type": "application/json", "Authorization": handler.headers["Authorization"]},
+        )
+        with urllib.request.urlopen(request) as response:
+            return json.load(response)
+
+    def _embeddings(self, texts: List[str]) -> List[List[float]]:
+        vectors = []
+        for text in texts:
+            seed = int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:16], 16)
+            vector = np.random.default_rng(seed).standard_normal(self.dim)
+            vectors.append((vector / np.linalg.norm(vector)).round(6).tolist())
+        return vectors
+
+    def _handle(self, handler: BaseHTTPRequestHandler, body: dict) -> None:
+        kind = self._kind(handler.path, body)
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+
+        if kind == "embed":
+            if self.record:
+                return self._send_json(handler, self._forward(handler, body))
+            sleep_with_jitter(self.embed_latency, self.jitter)
+            return self._send_json(handler, {
+                "id": uuid.uuid4().hex,
+                "response_type": "embeddings_floats",
+                "embeddings": self._embeddings(body.get("texts", [])),
+                "texts": body.get("texts", []),
+                "meta": {"api_version": {"version": "1"}},
+            })
+
+        if self.record:
+            recorded = self._forward(handler, body)
+            if kind == "fraud":
+                text = recorded["generations"][0]["text"]
+            else:
+                text = "".join(item.get("text", "") for item in recorded["message"]["content"])
+            with self._lock:
+                self.responses[kind] = text
+                os.makedirs(os.path.dirname(self.recordings_path), exist_ok=True)
+                with open(self.recordings_path, "w", encoding="utf-8") as f:
+                    json.dump({key: self.responses[key] for key in DEFAULT_COHERE_RESPONSES}, f, indent=2,
+                              ensure_ascii=False)
+        else:
+            text = self.responses[kind]
+            sleep_with_jitter(self.latency, self.jitter)
+
+        if body.get("stream"):
+            return self._send_stream(handler, text)
+        if kind == "fraud":
+            return self._send_json(handler, {
+                "id": uuid.uuid4().hex,
+                "generations": [{"id": uuid.uuid4().hex, "text": text, "finish_reason": "COMPLETE"}],
+                "prompt": body.get("prompt"),
+                "meta": {"api_version": {"version": "1"}},
+            })
+        return self._send_json(handler, {
+            "id": uuid.uuid4().hex,
+            "finish_reason": "COMPLETE",
+            "message": {"role": "assistant", "content": [{"type": "text", "text": text}]},
+            "usage": {"billed_units": {"input_tokens": 0, "output_tokens": 0}},
+        })
+
+    @staticmethod
+    def _send_json(handler: BaseHTTPRequestHandler, payload: dict) -> None:
+        data = json.dumps(payload).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_stream(self, handler: BaseHTTPRequestHandler, text: str) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+
+        def send(event: dict) -> None:
+            data = f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode()
+            handler.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            handler.wfile.flush()
+
+        send({"type": "message-start", "id": uuid.uuid4().hex, "delta": {"message": {"role": "assistant"}}})
+        for i, piece in enumerate(re.findall(r"\s*\S+\s*", text)):
+            if i and self.token_delay:
+                time.sleep(self.token_delay)
+            send({"type": "content-delta", "index": 0, "delta": {"message": {"content": {"text": piece}}}})
+        send({"type": "message-end", "delta": {"finish_reason": "COMPLETE"}})
+        handler.wfile.write(b"0\r\n\r\n")
+        handler.wfile.flush()
+
+    def start(self) -> "FakeCohereServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-cohere", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class FakePinecone:
+    """
+    In-process stand-in for the (Pinecone client, index) pair returned by
+    `validate_formdata.get_pinecone`: query embeddings and top-k search, each
+    blocking for `latency`. Matches come from `recordings_dir/pinecone.json`,
+    or are cut from `policy_pdf`'s text layer.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, dim: int = 1024,
+                 recordings_dir: str = RECORDINGS_DIR, policy_pdf: Optional[str] = None, chunk_chars: int = 1000):
+        self.latency = latency
+        self.jitter = jitter
+        self.dim = dim
+        self.calls = 0
+        self.inference = self
+        path = os.path.join(recordings_dir, "pinecone.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.matches = json.load(f)["matches"]
+        else:
+            text = ""
+            if policy_pdf is not None:
+                with open(policy_pdf, "rb") as f:
+                    text = pdf_text(f.read())
+            chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)] or ["Policy excerpt."]
+            self.matches = [
+                {"id": f"chunk-{i}", "score": round(0.9 - 0.05 * i, 2), "metadata": {"content": chunk}}
+                for i, chunk in enumerate(chunks[:3])
+            ]
+
+    def embed(self, model: str, inputs, parameters: Optional[dict] = None) -> dict:
+        self.calls += 1
+        sleep_with_jitter(self.latency, self.jitter)
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        return {"data": [{"values": [1.0 / self.dim ** 0.5] * self.dim} for _ in inputs]}
+
+    def query(self, namespace: str, vector, top_k: int = 3, include_metadata: bool = True, **kwargs) -> dict:
+        self.calls += 1
+        sleep_with_jitter(self.latency, self.jitter)
+        return {"matches": self.matches[:top_k], "namespace": namespace}
+
+    def Index(self, name: str) -> "FakePinecone":
+        return self
+
+
+class PineconeRecorder:
+    """Wraps a real Pinecone index and saves the latest query's matches for FakePinecone."""
+
+    def __init__(self, index, recordings_dir: str = RECORDINGS_DIR):
+        self.index = index
+        self.path = os.path.join(recordings_dir, "pinecone.json")
+
+    def query(self, **kwargs):
+        result = self.index.query(**kwargs)
+        matches = [
+            {"id": match["id"], "score": match["score"], "metadata": dict(match["metadata"] or {})}
+            for match in result["matches"]
+        ]
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"matches": matches}, f, indent=2, ensure_ascii=False)
+        return result
@@ -0,0 +1,140 @@
+import asyncio
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING, AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+if TYPE_CHECKING:
+    import httpx
+
+load_dotenv()
+
+# Connections kept open to the Cohere API; also caps concurrent calls per event loop
+MAX_CONNECTIONS = int(os.getenv("COHERE_MAX_CONNECTIONS", "20"))
+TIMEOUT = float(os.getenv("COHERE_TIMEOUT", "120"))
+
+# Long-lived Cohere clients shared by every module. Each one owns a pooled httpx
+# client, so calls reuse warm connections instead of a fresh TLS handshake per
+# request. v1 serves `generate`/`embed`, v2 serves chat. The SDK is imported on
+# first use so importing this module stays cheap.
+_sync_clients: Dict[int, object] = {}
+_sync_http: Optional["httpx.Client"] = None
+# httpx async connections belong to the loop that opened them, so async clients are per loop
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict]" = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def _client_class(version: int, asynchronous: bool):
+    import cohere
+
+    classes = {1: (cohere.Client, cohere.AsyncClient), 2: (cohere.ClientV2, cohere.AsyncClientV2)}
+    return classes[version][asynchronous]
+
+
+def _limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS)
+
+
+def _client_options() -> dict:
+    options = {"api_key": os.getenv("COHERE_API_KEY"), "timeout": TIMEOUT}
+    # COHERE_BASE_URL points every client at another host, e.g. a local fake server
+    if os.getenv("COHERE_BASE_URL"):
+        options["base_url"] = os.getenv("COHERE_BASE_URL")
+    return options
+
+
+def get_client(version: int = 2):
+    """Return the shared synchronous Cohere client for API `version` (1 or 2)."""
+    global _sync_http
+    client = _sync_clients.get(version)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(version)
+            if client is None:
+                if _sync_http is None:
+                    import httpx
+
+                    _sync_http = httpx.Client(limits=_limits(), timeout=TIMEOUT)
+                client = _client_class(version, False)(httpx_client=_sync_http, **_client_options())
+                _sync_clients[version] = client
+    return client
+
+
+def warm_up() -> None:
+    """Import the SDK and build the shared clients before the first request needs them."""
+    for version in (1, 2):
+        get_client(version)
+
+
+def _loop_state() -> dict:
+    loop = asyncio.get_running_loop()
+    state = _loop_clients.get(loop)
+    if state is None:
+        with _lock:
+            state = _loop_clients.get(loop)
+            if state is None:
+                import httpx
+
+                state = {
+                    "http": httpx.AsyncClient(limits=_limits(), timeout=TIMEOUT),
+                    "clients": {},
+                    "semaphore": asyncio.Semaphore(MAX_CONNECTIONS),
+                }
+                _loop_clients[loop] = state
+    return state
+
+
+def get_async_client(version: int = 2):
+    """Return the running event loop's shared asyncio Cohere client for API `version`."""
+    state = _loop_state()
+    client = state["clients"].get(version)
+    if client is None:
+        client = _client_class(version, True)(httpx_client=state["http"], **_client_options())
+        state["clients"][version] = client
+    return client
+
+
+async def chat(model: str, messages: List[dict], **params) -> str:
+    """One chat completion; returns the response text."""
+    async with _loop_state()["semaphore"]:
+        response = await get_async_client(2).chat(model=model, messages=messages, **params)
+    return "".join(item.text for item in response.message.content or [] if item.type == "text")
+
+
+async def chat_stream(model: str, messages: List[dict], **params) -> AsyncIterator[str]:
+    """Yield a chat completion's text deltas as Cohere streams them."""
+    async with _loop_state()["semaphore"]:
+        async for event in get_async_client(2).chat_stream(model=model, messages=messages, **params):
+            if event.type == "content-delta":
+                yield event.delta.message.content.text
+
+
+async def generate(model: str, prompt: str, **params) -> str:
+    """One legacy `generate` completion; returns the first generation's text."""
+    async with _loop_state()["semaphore"]:
+        response = await get_async_client(1).generate(model=model, prompt=prompt, **params)
+    return response.generations[0].text
+
+
+async def embed(texts: List[str], model: str, input_type: str) -> List[List[float]]:
+    """Embed `texts` in one call; returns one vector per text."""
+    async with _loop_state()["semaphore"]:
+        response = await get_async_client(1).embed(texts=texts, model=model, input_type=input_type)
+    return response.embeddings
+
+
+async def close_clients() -> None:
+    """Close the running loop's and the synchronous pooled connections, e.g. on application shutdown."""
+    global _sync_http
+    with _lock:
+        state = _loop_clients.pop(asyncio.get_running_loop(), None)
+        sync_http, _sync_http = _sync_http, None
+        _sync_clients.clear()
+    if sync_http is not None:
+        sync_http.close()
+    if state is not None:
+        await state["http"].aclose()
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from google.cloud import documentai  # type: ignore
+
+import tracing
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class DocumentCache:
+    """
+    Two-tier cache of Document AI results: an in-memory LRU in front of a disk
+    store. Entries are serialized `documentai.Document` protos keyed by the
+    SHA-256 of the document bytes plus the processor, version and request options,
+    so resubmitted attachments never reach the API twice.
+    """
+
+    def __init__(self, directory: str, memory_bytes: int, disk_bytes: int):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: Optional[int] = None
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(request: documentai.ProcessRequest, content_sha256: Optional[str] = None) -> str:
+        if content_sha256 is None:
+            content_sha256 = hashlib.sha256(request.raw_document.content).hexdigest()
+        # `name` carries the processor ID and, when pinned, the processor version
+        parts = [
+            content_sha256,
+            request.name,
+            ",".join(request.field_mask.paths),
+            documentai.ProcessOptions.serialize(request.process_options).hex(),
+        ]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.pb")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                tracing.mark_cache(True)
+                return data
+
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Bump mtime so disk eviction is least-recently-used
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            tracing.mark_cache(False)
+            return None
+
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, data)
+        tracing.mark_cache(True)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            self._remember(key, data)
+        self._write(key, data)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+            self.evictions += 1
+
+    def _write(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Document AI cache write failed: {e}")
+            return
+
+        with self._lock:
+            if self._disk_size is None:
+                self._disk_size = self._scan_disk_size()
+            else:
+                self._disk_size += len(data)
+            if self._disk_size > self.disk_bytes:
+                self._evict_disk()
+
+    def _entries(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(".pb"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield stat.st_mtime, stat.st_size, path
+
+    def _scan_disk_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict_disk(self) -> None:
+        # Drop the oldest entries until the store is back under 90% of its budget
+        target = int(self.disk_bytes * 0.9)
+        for _, size, path in sorted(self._entries()):
+            if self._disk_size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_size -= size
+            self.evictions += 1
+
+    def process(
+        self,
+        client: documentai.DocumentProcessorServiceClient,
+        request: documentai.ProcessRequest,
+        content_sha256: Optional[str] = None,
+    ) -> documentai.Document:
+        """Return `client.process_document(request).document`, served from cache when possible."""
+        key = self.key(request, content_sha256)
+        data = self.get(key)
+        if data is not None:
+            return documentai.Document.deserialize(data)
+
+        tracing.set_payload(len(request.raw_document.content))
+        document = client.process_document(request=request).document
+        self.put(key, documentai.Document.serialize(document))
+        return document
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "disk_bytes": self._disk_size,
+            }
+
+
+document_cache = DocumentCache(
+    directory=os.getenv("DOCAI_CACHE_DIR", os.path.join(CURRENT_DIR, ".cache", "documentai")),
+    memory_bytes=int(float(os.getenv("DOCAI_CACHE_MEMORY_MB", "64")) * 1024 * 1024),
+    disk_bytes=int(float(os.getenv("DOCAI_CACHE_DISK_MB", "1024")) * 1024 * 1024),
+)
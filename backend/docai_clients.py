@@ -0,0 +1,54 @@
+import os
+import threading
+from typing import Dict
+
+import grpc
+from google.api_core.client_options import ClientOptions
+from google.cloud import documentai  # type: ignore
+from google.cloud.documentai_v1.services.document_processor_service.transports import (
+    DocumentProcessorServiceGrpcTransport,
+)
+
+# Long-lived Document AI clients, one per endpoint. Building a client opens a new
+# gRPC channel (and TLS handshake), so every module shares these instead.
+_sync_clients: Dict[str, documentai.DocumentProcessorServiceClient] = {}
+_lock = threading.Lock()
+
+
+def endpoint_for(location: str) -> str:
+    # DOCAI_API_ENDPOINT points every location at one host, e.g. a local fake server
+    return os.getenv("DOCAI_API_ENDPOINT") or f"{location}-documentai.googleapis.com"
+
+
+def _insecure() -> bool:
+    return os.getenv("DOCAI_INSECURE") == "1"
+
+
+def get_client(location: str = "us") -> documentai.DocumentProcessorServiceClient:
+    """Return the shared synchronous client for `location`'s endpoint."""
+    endpoint = endpoint_for(location)
+    client = _sync_clients.get(endpoint)
+    if client is None:
+        with _lock:
+            client = _sync_clients.get(endpoint)
+            if client is None:
+                if _insecure():
+                    transport = DocumentProcessorServiceGrpcTransport(
+                        channel=grpc.insecure_channel(endpoint)
+                    )
+                    client = documentai.DocumentProcessorServiceClient(transport=transport)
+                else:
+                    client = documentai.DocumentProcessorServiceClient(
+                        client_options=ClientOptions(api_endpoint=endpoint)
+                    )
+                _sync_clients[endpoint] = client
+    return client
+
+
+async def close_clients() -> None:
+    """Close every pooled channel, e.g. on application shutdown."""
+    with _lock:
+        sync_clients = list(_sync_clients.values())
+        _sync_clients.clear()
+    for client in sync_clients:
+        client.transport.close()
@@ -0,0 +1,214 @@
+import bisect
+import hashlib
+import io
+import mmap
+import os
+import re
+import tempfile
+import zlib
+from typing import List, Optional, Union
+
+# Document AI helpers accept a file path or the document bytes themselves
+DocumentInput = Union[str, bytes, bytearray, memoryview]
+
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Uploads larger than this are spooled to disk instead of held in memory
+SPOOL_THRESHOLD = int(float(os.getenv("UPLOAD_SPOOL_MB", "4")) * 1024 * 1024)
+MAX_UPLOAD_BYTES = int(float(os.getenv("MAX_UPLOAD_MB", "25")) * 1024 * 1024)
+# Limits for all files of one request together
+MAX_REQUEST_BYTES = int(float(os.getenv("MAX_REQUEST_MB", "60")) * 1024 * 1024)
+MAX_REQUEST_FILES = int(os.getenv("MAX_REQUEST_FILES", "10"))
+
+
+# Scan limits keep PDF inspection cheap on large scans
+MAX_STREAM_BYTES = 256 * 1024
+MAX_DECODED_BYTES = 4 * 1024 * 1024
+
+_STREAM_RE = re.compile(rb"stream\r?\n")
+_IMAGE_RE = re.compile(rb"/Subtype\s*/Image\b")
+_PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+# A page tree node (a /Type /Pages dictionary with no nested dictionaries); the root's /Count is the page total
+_PAGES_NODE_RE = re.compile(rb"<<(?:(?!<<|>>).)*?/Type\s*/Pages\b(?:(?!<<|>>).)*>>", re.S)
+_COUNT_RE = re.compile(rb"/Count\s+(\d+)")
+_OBJ_RE = re.compile(rb"(\d+)\s+\d+\s+obj\b")
+# An object stream starts with "<object number> <offset>" pairs
+_OBJSTM_HEADER_RE = re.compile(rb"\s*((?:\d+\s+\d+\s+)+)")
+
+
+def read_document(document: DocumentInput) -> bytes:
+    """Return the document's bytes, reading from disk only when given a path."""
+    if isinstance(document, bytes):
+        return document
+    if isinstance(document, (bytearray, memoryview)):
+        return bytes(document)
+    with open(document, "rb") as f:
+        return f.read()
+
+
+def inflate_streams(content: bytes) -> List[bytes]:
+    """
+    Inflate a PDF's non-image Flate streams (page content and object streams)
+    up to a fixed budget, so they can be scanned without a PDF library.
+    """
+    view = memoryview(content)
+    decoded = []
+    decoded_size = 0
+    for match in _STREAM_RE.finditer(content):
+        if decoded_size >= MAX_DECODED_BYTES:
+            break
+        # Image data is never useful here; only inflate Flate streams that aren't images
+        header = content[max(0, match.start() - 400):match.start()]
+        if _IMAGE_RE.search(header) or b"/FlateDecode" not in header:
+            continue
+        try:
+            data = zlib.decompressobj().decompress(view[match.end():], MAX_STREAM_BYTES)
+        except zlib.error:
+            continue
+        decoded.append(data)
+        decoded_size += len(data)
+    return decoded
+
+
+def _page_object_numbers(data: bytes, object_stream: bool) -> set:
+    """Object numbers of the `/Type /Page` dictionaries in raw PDF bytes or a decoded object stream."""
+    if object_stream:
+        header = _OBJSTM_HEADER_RE.match(data)
+        if header is None:
+            return set()
+        numbers = [int(n) for n in header.group(1).split()]
+        objects, offsets = numbers[0::2], numbers[1::2]
+        first = header.end()
+    else:
+        matches = [(m.start(), int(m.group(1))) for m in _OBJ_RE.finditer(data)]
+        offsets = [position for position, _ in matches]
+        objects = [number for _, number in matches]
+        first = 0
+
+    found = set()
+    for match in _PAGE_RE.finditer(data):
+        index = bisect.bisect_right(offsets, match.start() - first) - 1
+        if index >= 0:
+            found.add(objects[index])
+    return found
+
+
+def count_pdf_pages(content: bytes, decoded: Optional[List[bytes]] = None) -> int:
+    """
+    Count pages from the page tree root's `/Count` (the latest one, since
+    incremental updates append a rewritten root). Only when no root is found
+    are `/Type /Page` objects counted, each object number once, including
+    those inside compressed object streams.
+    """
+    if decoded is None:
+        decoded = inflate_streams(content)
+    root_count = None
+    for data in [content, *decoded]:
+        for node in _PAGES_NODE_RE.findall(data):
+            count = _COUNT_RE.search(node)
+            if count is not None and b"/Parent" not in node:
+                root_count = int(count.group(1))
+    if root_count:
+        return root_count
+
+    pages = _page_object_numbers(content, object_stream=False)
+    for data in decoded:
+        pages |= _page_object_numbers(data, object_stream=True)
+    return max(1, len(pages))
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadBuffer:
+    """
+    Write-once buffer for an uploaded file that hashes while it is written.
+
+    Data stays in memory up to `spool_threshold` bytes and moves to an anonymous
+    temp file past that; `view()` exposes the contents without copying (a memory
+    map once spooled).
+    """
+
+    def __init__(self, spool_threshold: int = SPOOL_THRESHOLD, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.spool_threshold = spool_threshold
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._memory: Optional[io.BytesIO] = io.BytesIO()
+        self._disk = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+
+    @property
+    def spooled(self) -> bool:
+        return self._disk is not None
+
+    @property
+    def sha256(self) -> str:
+        return self._sha.hexdigest()
+
+    def write(self, chunk: bytes) -> None:
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes")
+        self._sha.update(chunk)
+        if self._disk is None and self.size > self.spool_threshold:
+            self._disk = tempfile.TemporaryFile()
+            self._disk.write(self._memory.getbuffer())
+            self._memory = None
+        (self._disk or self._memory).write(chunk)
+
+    def view(self) -> memoryview:
+        if self._disk is None:
+            view = self._memory.getbuffer()
+        else:
+            if self._mmap is None:
+                self._disk.flush()
+                self._mmap = mmap.mmap(self._disk.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mmap)
+        self._views.append(view)
+        return view
+
+    def close(self) -> None:
+        for view in self._views:
+            view.release()
+        self._views.clear()
+        if self._mmap is not None:
+            self._mmap.close()
+        if self._disk is not None:
+            self._disk.close()
+        self._memory = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def buffer_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE, **buffer_options) -> UploadBuffer:
+    """Load a file from disk into an `UploadBuffer`, e.g. for queued jobs."""
+    buffer = UploadBuffer(**buffer_options)
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                buffer.write(chunk)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
+
+
+async def read_upload(file, chunk_size: int = UPLOAD_CHUNK_SIZE, **buffer_options) -> UploadBuffer:
+    """Read an `UploadFile` in chunks into an `UploadBuffer`."""
+    buffer = UploadBuffer(**buffer_options)
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            buffer.write(chunk)
+    except BaseException:
+        buffer.close()
+        raise
+    return buffer
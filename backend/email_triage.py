@@ -0,0 +1,291 @@
+"""
+Decide which emails are about insurance claims, cheaply where possible.
+
+A keyword gate and a small logistic regression over hashed TF-IDF features
+settle clear cases locally; only emails the model is unsure about go to the
+LLM, several per prompt.
+
+Usage (from backend/), with labeled history as JSON lines of {"text", "label"}:
+    python email_triage.py train emails.jsonl
+    python email_triage.py evaluate emails_holdout.jsonl [--llm]
+"""
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import cohere_clients
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_PATH = os.getenv("TRIAGE_MODEL_PATH", os.path.join(CURRENT_DIR, ".cache", "email_triage.npz"))
+# Model probabilities outside [LOW, HIGH] are settled locally
+LOW = float(os.getenv("TRIAGE_LOW", "0.15"))
+HIGH = float(os.getenv("TRIAGE_HIGH", "0.85"))
+# Ambiguous emails per LLM prompt, and characters kept from each
+LLM_BATCH_SIZE = int(os.getenv("TRIAGE_LLM_BATCH_SIZE", "10"))
+LLM_MAX_CHARS = int(os.getenv("TRIAGE_LLM_MAX_CHARS", "2000"))
+TRIAGE_MODEL = "command-r-plus-08-2024"
+
+N_FEATURES = 2 ** 18
+
+# An email mentioning none of these is not a claim, whatever else it says
+INSURANCE_TERMS = re.compile(
+    r"\b(claims?|insur\w*|polic(y|ies)|coverage|covered|reimburse\w*|deductible|premium|adjuster|"
+    r"insurer|eob|explanation of benefits|medical bills?|hospital\w*|accident|beneficiary|payout)\b",
+    re.IGNORECASE,
+)
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokens(text: str) -> List[str]:
+    words = _TOKEN.findall(text.lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _hashed_counts(text: str) -> dict:
+    counts = {}
+    for token in tokens(text):
+        index = zlib.crc32(token.encode("utf-8")) % N_FEATURES
+        counts[index] = counts.get(index, 0) + 1
+    return counts
+
+
+class TriageModel:
+    """L2-regularized logistic regression over hashed, sublinear TF-IDF unigrams and bigrams."""
+
+    def __init__(self, weights: np.ndarray, bias: float, idf: np.ndarray):
+        self.weights = weights
+        self.bias = bias
+        self.idf = idf
+
+    @staticmethod
+    def _matrix(texts: Sequence[str], idf: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """CSR arrays (indptr, indices, values) with L2-normalized rows."""
+        indptr, indices, values = [0], [], []
+        for text in texts:
+            counts = _hashed_counts(text)
+            row_indices = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            row_values = 1 + np.log(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+            if idf is not None:
+                row_values *= idf[row_indices]
+            norm = np.linalg.norm(row_values)
+            indices.append(row_indices)
+            values.append(row_values / norm if norm else row_values)
+            indptr.append(indptr[-1] + len(counts))
+        return (
+            np.asarray(indptr),
+            np.concatenate(indices) if indices else np.empty(0, dtype=np.int64),
+            np.concatenate(values).astype(np.float32) if values else np.empty(0, dtype=np.float32),
+        )
+
+    @staticmethod
+    def _scores(weights, bias, indptr, indices, values) -> np.ndarray:
+        rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+        return np.bincount(rows, weights=weights[indices] * values, minlength=len(indptr) - 1) + bias
+
+    @classmethod
+    def train(cls, texts: Sequence[str], labels: Sequence[int], epochs: int = 300,
+              learning_rate: float = 2.0, l2: float = 1e-4) -> "TriageModel":
+        document_frequency = np.zeros(N_FEATURES, dtype=np.float32)
+        for text in texts:
+            document_frequency[list(_hashed_counts(text))] += 1
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)).astype(np.float32) + 1
+
+        indptr, indices, values = cls._matrix(texts, idf)
+        rows = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        y = np.asarray(labels, dtype=np.float32)
+        weights = np.zeros(N_FEATURES, dtype=np.float32)
+        bias = 0.0
+        # Full-batch gradient descent; the feature matrix is only touched through CSR arrays
+        for _ in range(epochs):
+            p = 1 / (1 + np.exp(-cls._scores(weights, bias, indptr, indices, values)))
+            error = (p - y) / len(texts)
+            gradient = np.bincount(indices, weights=error[rows] * values, minlength=N_FEATURES)
+            weights -= learning_rate * (gradient.astype(np.float32) + l2 * weights)
+            bias -= learning_rate * float(error.sum())
+        return cls(weights, bias, idf)
+
+    def predict_proba(self, texts: Sequence[str]) -> np.ndarray:
+        indptr, indices, values = self._matrix(texts, self.idf)
+        return 1 / (1 + np.exp(-self._scores(self.weights, self.bias, indptr, indices, values)))
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Only non-zero weights are stored; most hashed buckets are never seen
+        nonzero = np.flatnonzero(self.weights)
+        np.savez_compressed(path, indices=nonzero, weights=self.weights[nonzero], bias=self.bias, idf=self.idf)
+
+    @classmethod
+    def load(cls, path: str) -> "TriageModel":
+        data = np.load(path)
+        weights = np.zeros(N_FEATURES, dtype=np.float32)
+        weights[data["indices"]] = data["weights"]
+        return cls(weights, float(data["bias"]), data["idf"])
+
+
+_model: Optional[TriageModel] = None
+_model_loaded = False
+_lock = threading.Lock()
+stats = {"emails": 0, "local_decisions": 0, "llm_emails": 0, "llm_calls": 0}
+
+
+def get_model() -> Optional[TriageModel]:
+    """The trained model, or None if `train` has not been run."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        with _lock:
+            if not _model_loaded:
+                _model = TriageModel.load(MODEL_PATH) if os.path.exists(MODEL_PATH) else None
+                _model_loaded = True
+    return _model
+
+
+def local_verdicts(texts: Sequence[str]) -> List[Optional[bool]]:
+    """True/False where the local pass is confident, None where the LLM should decide."""
+    verdicts: List[Optional[bool]] = [None if INSURANCE_TERMS.search(text) else False for text in texts]
+    model = get_model()
+    pending = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    if model is not None and pending:
+        for i, p in zip(pending, model.predict_proba([texts[i] for i in pending])):
+            if p >= HIGH:
+                verdicts[i] = True
+            elif p <= LOW:
+                verdicts[i] = False
+    return verdicts
+
+
+def _triage_prompt(texts: Sequence[str]) -> str:
+    emails = "\n\n".join(f"<email id={i + 1}>\n{text[:LLM_MAX_CHARS]}\n</email>" for i, text in enumerate(texts))
+    return (
+        "You are a helpful assistant that determines if emails are about an insurance claim. "
+        f"For each of the {len(texts)} emails below, decide whether it is about an insurance claim. "
+        'Respond with ONLY a JSON object mapping each email id to "yes" or "no", '
+        'for example {"1": "yes", "2": "no"}.\n\n' + emails
+    )
+
+
+def llm_verdicts(texts: Sequence[str]) -> List[bool]:
+    """One chat call per LLM_BATCH_SIZE emails; emails missing from the reply count as 'no'."""
+    verdicts = []
+    for start in range(0, len(texts), LLM_BATCH_SIZE):
+        batch = texts[start:start + LLM_BATCH_SIZE]
+        answers = {}
+        try:
+            response = cohere_clients.get_client().chat(
+                model=TRIAGE_MODEL,
+                messages=[{"role": "user", "content": _triage_prompt(batch)}],
+                temperature=0,
+            )
+            reply = "".join(item.text for item in response.message.content or [] if item.type == "text")
+            match = re.search(r"\{.*\}", reply, re.DOTALL)
+            answers = json.loads(match.group(0)) if match else {}
+        except Exception as e:
+            print(f"Error in Cohere chat: {e}")
+        with _lock:
+            stats["llm_calls"] += 1
+            stats["llm_emails"] += len(batch)
+        verdicts += [str(answers.get(str(i + 1), "no")).strip().lower() == "yes" for i in range(len(batch))]
+    return verdicts
+
+
+def triage(texts: Sequence[str]) -> List[bool]:
+    """Classify a batch of emails: local pass first, one batched LLM prompt for the rest."""
+    verdicts = local_verdicts(texts)
+    ambiguous = [i for i, verdict in enumerate(verdicts) if verdict is None]
+    for i, verdict in zip(ambiguous, llm_verdicts([texts[i] for i in ambiguous])):
+        verdicts[i] = verdict
+    with _lock:
+        stats["emails"] += len(texts)
+        stats["local_decisions"] += len(texts) - len(ambiguous)
+    return verdicts
+
+
+def llm_calls_saved() -> int:
+    """LLM calls avoided versus one call per email."""
+    with _lock:
+        return stats["emails"] - stats["llm_calls"]
+
+
+def _load_labeled(path: str) -> Tuple[List[str], List[int]]:
+    texts, labels = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(record["text"])
+                labels.append(int(bool(record["label"])))
+    return texts, labels
+
+
+def _precision_recall(predicted: Sequence[bool], labels: Sequence[int]) -> dict:
+    true_positives = sum(1 for p, y in zip(predicted, labels) if p and y)
+    predicted_positives = sum(1 for p in predicted if p)
+    positives = sum(labels)
+    return {
+        "precision": round(true_positives / predicted_positives, 4) if predicted_positives else None,
+        "recall": round(true_positives / positives, 4) if positives else None,
+        "n": len(labels),
+    }
+
+
+def evaluate(path: str, use_llm: bool = False) -> dict:
+    """
+    Precision/recall of the local pass on the emails it settles, and end to end
+    with ambiguous emails sent to the LLM (`use_llm`) or, offline, decided by the
+    model at p >= 0.5. Also reports how many LLM calls the triage saves.
+    """
+    texts, labels = _load_labeled(path)
+    verdicts = local_verdicts(texts)
+    settled = [i for i, verdict in enumerate(verdicts) if verdict is not None]
+    ambiguous = [i for i, verdict in enumerate(verdicts) if verdict is None]
+
+    final = list(verdicts)
+    if use_llm:
+        resolved = llm_verdicts([texts[i] for i in ambiguous])
+    else:
+        model = get_model()
+        probabilities = model.predict_proba([texts[i] for i in ambiguous]) if model and ambiguous else []
+        resolved = [bool(p >= 0.5) for p in probabilities] or [False] * len(ambiguous)
+    for i, verdict in zip(ambiguous, resolved):
+        final[i] = verdict
+
+    llm_calls = math.ceil(len(ambiguous) / LLM_BATCH_SIZE)
+    return {
+        "emails": len(texts),
+        "settled_locally": len(settled),
+        "coverage": round(len(settled) / len(texts), 4) if texts else 0.0,
+        "local": _precision_recall([verdicts[i] for i in settled], [labels[i] for i in settled]),
+        "end_to_end": _precision_recall(final, labels),
+        "ambiguous_resolved_by": "llm" if use_llm else "model",
+        "llm_calls": llm_calls,
+        "llm_calls_baseline": len(texts),
+        "llm_calls_saved": len(texts) - llm_calls,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Fit the local model on labeled emails")
+    train_parser.add_argument("data")
+    evaluate_parser = subparsers.add_parser("evaluate", help="Report precision, recall and LLM calls saved")
+    evaluate_parser.add_argument("data")
+    evaluate_parser.add_argument("--llm", action="store_true", help="Resolve ambiguous emails with the LLM")
+    args = parser.parse_args()
+
+    if args.command == "train":
+        texts, labels = _load_labeled(args.data)
+        TriageModel.train(texts, labels).save(MODEL_PATH)
+        print(f"Trained on {len(texts)} emails ({sum(labels)} insurance-related); saved {MODEL_PATH}")
+    else:
+        print(json.dumps(evaluate(args.data, args.llm), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+# Cohere's embed endpoint accepts up to 96 texts per call
+MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "96"))
+BATCH_WINDOW = float(os.getenv("EMBED_BATCH_WINDOW_MS", "10")) / 1000
+MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+
+# embed_fn(texts, model, input_type) -> one vector per text
+EmbedFn = Callable[[List[str], str, str], Sequence[Sequence[float]]]
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batcher for embed calls. Requests from every thread are gathered for up
+    to `window` seconds after the first one arrives, grouped by model and input
+    type, and sent as batched calls of at most `max_batch` texts, with up to
+    `max_in_flight` calls running at once.
+    """
+
+    def __init__(
+        self,
+        embed_fn: EmbedFn,
+        window: float = BATCH_WINDOW,
+        max_batch: int = MAX_BATCH,
+        max_in_flight: int = MAX_IN_FLIGHT,
+    ):
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch = max_batch
+        self._senders = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-send")
+        self._queue: "queue.Queue[Tuple[str, str, str, Future]]" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.api_calls = 0
+        self.texts = 0
+
+    def submit(self, text: str, model: str, input_type: str) -> "Future[np.ndarray]":
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                    self._thread.start()
+        future: "Future[np.ndarray]" = Future()
+        self._queue.put((text, model, input_type, future))
+        return future
+
+    def _collect(self) -> List[Tuple[str, str, str, Future]]:
+        pending = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                pending.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            groups: Dict[Tuple[str, str], List[Tuple[str, Future]]] = defaultdict(list)
+            for text, model, input_type, future in self._collect():
+                groups[(model, input_type)].append((text, future))
+            for (model, input_type), requests in groups.items():
+                for i in range(0, len(requests), self.max_batch):
+                    self._senders.submit(self._send, model, input_type, requests[i:i + self.max_batch])
+
+    def _send(self, model: str, input_type: str, requests: List[Tuple[str, Future]]) -> None:
+        # Identical texts in one window are embedded once
+        texts = list(dict.fromkeys(text for text, _ in requests))
+        try:
+            vectors = self.embed_fn(texts, model, input_type)
+            if len(vectors) != len(texts):
+                raise ValueError(f"Embed call returned {len(vectors)} vectors for {len(texts)} texts")
+        except Exception as e:
+            for _, future in requests:
+                future.set_exception(e)
+            return
+        with self._stats_lock:
+            self.api_calls += 1
+            self.texts += len(texts)
+        by_text = {text: np.asarray(vector, dtype=np.float32) for text, vector in zip(texts, vectors)}
+        for text, future in requests:
+            future.set_result(by_text[text])
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {
+                "api_calls": self.api_calls,
+                "texts": self.texts,
+                "texts_per_call": round(self.texts / self.api_calls, 2) if self.api_calls else 0.0,
+                "window_ms": self.window * 1000,
+                "max_batch": self.max_batch,
+            }
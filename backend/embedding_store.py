@@ -0,0 +1,137 @@
+import fcntl
+import hashlib
+import os
+import re
+import threading
+from typing import Dict, Optional
+
+import numpy as np
+
+import tracing
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def text_key(text: str, input_type: str = "") -> str:
+    return hashlib.sha256(f"{input_type}\0{text}".encode("utf-8")).hexdigest()
+
+
+class _ModelStore:
+    """
+    One model's vectors: `<name>.f32` holds float32 rows back to back and
+    `<name>.idx` maps key -> row, one `key row dim` line per entry. Both files are
+    append-only, so readers in other workers only need to read the index tail
+    and remap the array when it grows.
+    """
+
+    def __init__(self, directory: str, model: str):
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", model)
+        self.vectors_path = os.path.join(directory, f"{safe}.f32")
+        self.index_path = os.path.join(directory, f"{safe}.idx")
+        self.lock_path = os.path.join(directory, f"{safe}.lock")
+        self.dim: Optional[int] = None
+        self.rows: Dict[str, int] = {}
+        self._index_offset = 0
+        self._matrix: Optional[np.memmap] = None
+
+    def _refresh_index(self) -> None:
+        try:
+            with open(self.index_path, "r", encoding="ascii") as f:
+                f.seek(self._index_offset)
+                for line in f:
+                    if not line.endswith("\n"):
+                        break  # partially written line; read it next time
+                    key, row, dim = line.split()
+                    self.rows[key] = int(row)
+                    self.dim = int(dim)
+                    self._index_offset += len(line)
+        except FileNotFoundError:
+            pass
+
+    def _vectors(self, row: int) -> Optional[np.memmap]:
+        if self._matrix is None or row >= self._matrix.shape[0]:
+            size = os.path.getsize(self.vectors_path)
+            rows = size // (self.dim * 4)
+            if row >= rows:
+                return None
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if key not in self.rows:
+            self._refresh_index()
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        matrix = self._vectors(row)
+        return None if matrix is None else np.array(matrix[row])
+
+    def put(self, key: str, vector: np.ndarray) -> None:
+        vector = np.ascontiguousarray(vector, dtype=np.float32).reshape(-1)
+        with open(self.lock_path, "a") as lock:
+            # The file lock serialises appends across worker processes
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                if key in self.rows:
+                    return
+                if self.dim is not None and vector.shape[0] != self.dim:
+                    raise ValueError(f"Expected {self.dim}-dim vector, got {vector.shape[0]}")
+                dim = vector.shape[0]
+                with open(self.vectors_path, "ab") as f:
+                    size = f.tell()
+                    row = size // (dim * 4)
+                    if size % (dim * 4):
+                        f.truncate(row * dim * 4)  # drop a torn row left by a crashed writer
+                    f.write(vector.tobytes())
+                # The index line is written last, so readers never see a row before its data
+                with open(self.index_path, "a", encoding="ascii") as f:
+                    f.write(f"{key} {row} {dim}\n")
+                self._refresh_index()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+class EmbeddingStore:
+    """Persistent float32 embedding cache keyed by text hash and model name."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._models: Dict[str, _ModelStore] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _model(self, model: str) -> _ModelStore:
+        store = self._models.get(model)
+        if store is None:
+            os.makedirs(self.directory, exist_ok=True)
+            store = self._models.setdefault(model, _ModelStore(self.directory, model))
+        return store
+
+    def get(self, model: str, text: str, input_type: str = "") -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._model(model).get(text_key(text, input_type))
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            tracing.mark_cache(vector is not None)
+            return vector
+
+    def put(self, model: str, text: str, vector: np.ndarray, input_type: str = "") -> None:
+        with self._lock:
+            self._model(model).put(text_key(text, input_type), vector)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": {model: len(store.rows) for model, store in self._models.items()},
+            }
+
+
+embedding_store = EmbeddingStore(
+    os.getenv("EMBEDDING_STORE_DIR", os.path.join(CURRENT_DIR, ".cache", "embeddings"))
+)
@@ -1,38 +1,60 @@
-import json
-from sentence_transformers import SentenceTransformer
-
-def get_embeddings(data, model_name='all-MiniLM-L6-v2', split_by='\n'):
-    """
-    Generates embeddings for text chunks from a raw text file and saves them to a JSON file.
+import threading
+from typing import Dict, Iterator, Tuple
 
-    Args:
-        input_file_path (str): Path to the input text file.
-        output_file_path (str): Path to the output JSON file where embeddings will be saved.
-        model_name (str): Name of the pre-trained SentenceTransformer model to use.
-        split_by (str): Delimiter to split the raw text into chunks (e.g., '\n' for lines).
+import numpy as np
+from sentence_transformers import SentenceTransformer
 
-    Returns:
-        None
-    """
-    # Load the raw text from the input file
-    raw_text = data
+# Models are loaded once per process and shared by every caller
+_models: Dict[str, SentenceTransformer] = {}
+_models_lock = threading.Lock()
 
-    # Initialize the pre-trained model for embedding generation
-    embedding_model = SentenceTransformer(model_name)
 
-    # Split the raw text into chunks
-    text_chunks = raw_text.split(split_by)
+def get_model(model_name='all-MiniLM-L6-v2') -> SentenceTransformer:
+    model = _models.get(model_name)
+    if model is None:
+        with _models_lock:
+            model = _models.get(model_name)
+            if model is None:
+                model = SentenceTransformer(model_name)
+                _models[model_name] = model
+    return model
 
-    # Generate embeddings for each chunk
-    embeddings = [embedding_model.encode(chunk).tolist() for chunk in text_chunks]
 
-    # Prepare embeddings data with IDs
-    embeddings_data = [{"id": idx, "embedding": embedding} for idx, embedding in enumerate(embeddings)]
+def warm_up(model_name='all-MiniLM-L6-v2') -> None:
+    """Load the model and run one encode so the first request doesn't pay for it."""
+    get_model(model_name).encode(["warm up"], convert_to_numpy=True)
 
 
-    print(f"Embeddings generated!")
+def iter_embeddings(data, model_name='all-MiniLM-L6-v2', split_by='\n', batch_size=64) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Embed text chunks in batches, yielding (first chunk index, float32 matrix) per
+    batch so large inputs never need all their embeddings in memory at once.
+    """
+    embedding_model = get_model(model_name)
+    text_chunks = data.split(split_by)
+    for start in range(0, len(text_chunks), batch_size):
+        batch = embedding_model.encode(
+            text_chunks[start:start + batch_size],
+            batch_size=batch_size,
+            convert_to_numpy=True,
+        )
+        yield start, np.ascontiguousarray(batch, dtype=np.float32)
+
+
+def get_embeddings(data, model_name='all-MiniLM-L6-v2', split_by='\n', batch_size=64) -> np.ndarray:
+    """
+    Generates embeddings for the text chunks of a raw string.
 
-    return embeddings_data
+    Args:
+        data (str): Raw text to embed.
+        model_name (str): Name of the pre-trained SentenceTransformer model to use.
+        split_by (str): Delimiter to split the raw text into chunks (e.g., '\n' for lines).
+        batch_size (int): Number of chunks encoded per forward pass.
 
-# Example usage:
-# generate_and_save_embeddings('raw_string_data.txt', 'embeddings.json')
\ No newline at end of file
+    Returns:
+        np.ndarray: Contiguous float32 matrix with one row per chunk; row i is chunk i.
+    """
+    batches = [batch for _, batch in iter_embeddings(data, model_name, split_by, batch_size)]
+    if not batches:
+        return np.empty((0, get_model(model_name).get_sentence_embedding_dimension()), dtype=np.float32)
+    return np.concatenate(batches) if len(batches) > 1 else batches[0]
@@ -2,42 +2,69 @@ from __future__ import print_function
 
 import os.path
 import os  # for creating directories
-import cohere
-from dotenv import load_dotenv
-
-load_dotenv()
-co = cohere.ClientV2(api_key=os.getenv("COHERE_API_KEY"))
 
+import email_triage
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-import email
 import base64 #add Base64
+import json
+import threading
 import time 
+from concurrent.futures import ThreadPoolExecutor
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+
+from attachment_store import attachment_store
+from documents import MAX_REQUEST_BYTES, MAX_REQUEST_FILES, MAX_UPLOAD_BYTES
+from upload_forwarder import forwarder
 
 # Update scope to include modify permission
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
+# Where the last synced historyId is kept between runs
+STATE_PATH = os.getenv("GMAIL_STATE_PATH", "gmail_state.json")
+# Gmail allows up to 100 calls per batch request but throttles batches above 50
+BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+# Attachments downloaded at once across all messages
+ATTACHMENT_CONCURRENCY = int(os.getenv("GMAIL_ATTACHMENT_CONCURRENCY", "4"))
+# Rounds of batched gets per sync; messages still failing are retried on the next sync
+FETCH_ATTEMPTS = int(os.getenv("GMAIL_FETCH_ATTEMPTS", "3"))
+
+attachment_pool = ThreadPoolExecutor(max_workers=ATTACHMENT_CONCURRENCY, thread_name_prefix="attachment")
+_local = threading.local()
 
-def mark_as_read(service, msg_id):
+
+def mark_as_read(service, msg_ids, stats=None):
+    """Remove the UNREAD label from every message in one batchModify call per 1000 IDs."""
+    for start in range(0, len(msg_ids), 1000):
+        try:
+            service.users().messages().batchModify(
+                userId='me',
+                body={'ids': msg_ids[start:start + 1000], 'removeLabelIds': ['UNREAD']}
+            ).execute()
+            if stats is not None:
+                stats['http_requests'] += 1
+                stats['api_calls'] += 1
+            print(f"Marked {len(msg_ids[start:start + 1000])} messages as read")
+        except HttpError as error:
+            print(f'An error occurred while marking messages as read: {error}')
+
+def mark_as_unread(service, msg_id):
+    """Put the UNREAD label back so a claim that could not be forwarded stays visible."""
     try:
-        # Remove UNREAD label from the message
         service.users().messages().modify(
-            userId='me',
-            id=msg_id,
-            body={'removeLabelIds': ['UNREAD']}
-        ).execute()
-        print(f"Marked message {msg_id} as read")
+            userId='me', id=msg_id, body={'addLabelIds': ['UNREAD']}
+        ).execute(http=_thread_http(service))
     except HttpError as error:
-        print(f'An error occurred while marking message as read: {error}')
+        print(f'An error occurred while marking message {msg_id} as unread: {error}')
 
-def main():
-    """Shows basic usage of the Gmail API.
-    Lists the user's Gmail labels.
-    """
+def get_service():
+    """Build the Gmail API client, running the OAuth flow if there is no valid token."""
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first
@@ -55,178 +82,315 @@ def main():
         # Save the credentials for the next run
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
-            
-        #Filter and get the IDs of the message I need. 
-        #I'm just filtering messages that have the label "UNREAD"
 
+    return build('gmail', 'v1', credentials=creds)
+
+def load_state():
+    """The last synced historyId and the IDs of messages that could not be fetched then."""
     try:
-        service = build('gmail', 'v1', credentials=creds)
-        search_id = service.users().messages().list(userId='me', labelIds="UNREAD").execute()
-        number_result = search_id['resultSizeEstimate']
-
-        final_list = [] # empty array, all the messages ID will be listed here
-        
-        # review if the search is empty or not
-        # if it has messages on it, It will enter the for
-
-        if number_result>0:
-            message_ids = search_id['messages']
-
-            for ids in message_ids:
-                msg_id = ids['id']
-                final_list.append(msg_id)
-                # call the function that will call the body of the message
-                get_message(service, msg_id)
-                # Mark the message as read
-                mark_as_read(service, msg_id)
-                
-            return final_list
-        
-        # If there are not messages with those criterias 
-        #The message 'There were 0 results for that search string' will be printed. 
+        with open(STATE_PATH, 'r') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    return state.get('history_id'), state.get('retry_ids', [])
+
+def save_state(history_id, retry_ids):
+    tmp_path = STATE_PATH + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'history_id': history_id, 'retry_ids': retry_ids}, f)
+    os.replace(tmp_path, STATE_PATH)
 
+def list_unread(service, stats):
+    """IDs of every UNREAD message, following nextPageToken through all pages."""
+    msg_ids = []
+    page_token = None
+    while True:
+        response = service.users().messages().list(
+            userId='me', labelIds=['UNREAD'], pageToken=page_token, maxResults=500
+        ).execute()
+        stats['http_requests'] += 1
+        stats['api_calls'] += 1
+        msg_ids += [message['id'] for message in response.get('messages', [])]
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return msg_ids
+
+def list_added_since(service, history_id, stats):
+    """
+    IDs of messages added since `history_id` (every page), plus the mailbox's
+    latest historyId. Raises HttpError 404 when the stored ID is too old.
+    """
+    msg_ids = []
+    page_token = None
+    while True:
+        response = service.users().history().list(
+            userId='me', startHistoryId=history_id, historyTypes=['messageAdded'], pageToken=page_token
+        ).execute()
+        stats['http_requests'] += 1
+        stats['api_calls'] += 1
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                msg_ids.append(added['message']['id'])
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            return list(dict.fromkeys(msg_ids)), response['historyId']
+
+def fetch_messages(service, msg_ids, stats, attempts=FETCH_ATTEMPTS):
+    """
+    Fetch full messages in batch HTTP requests of BATCH_SIZE. Gets that fail inside
+    a batch (Gmail often answers busy batches with 429) are retried with backoff,
+    up to `attempts` rounds. Returns `({id: message}, [IDs that still failed])`.
+    """
+    messages = {}
+    errors = {}
+
+    def on_message(request_id, response, exception):
+        if isinstance(exception, HttpError) and exception.resp.status == 404:
+            print(f'Message {request_id} no longer exists')  # deleted since it was listed
+        elif exception is not None:
+            errors[request_id] = exception
         else:
-            print('There were 0 results for that search string')
-            return ""
+            messages[request_id] = response
 
-    except HttpError as error:
-        # TODO(developer) - Handle errors from gmail API.
-        print(f'An error occurred: {error}')
-        
-        
-        #new function to get the body of the message, and decode the message
+    pending = list(msg_ids)
+    for attempt in range(attempts):
+        if attempt:
+            delay = min(2 ** attempt, 30)
+            print(f'Retrying {len(pending)} failed message fetches in {delay}s')
+            time.sleep(delay)
+        errors.clear()
+        for start in range(0, len(pending), BATCH_SIZE):
+            batch = service.new_batch_http_request(callback=on_message)
+            for msg_id in pending[start:start + BATCH_SIZE]:
+                batch.add(service.users().messages().get(userId='me', id=msg_id, format='full'), request_id=msg_id)
+            batch.execute()
+            stats['http_requests'] += 1
+            stats['api_calls'] += len(pending[start:start + BATCH_SIZE])
+        pending = [msg_id for msg_id in pending if msg_id in errors]
+        if not pending:
+            break
+    for msg_id in pending:
+        print(f'An error occurred fetching message {msg_id}: {errors[msg_id]}')
+    return messages, pending
+
+def sync(service):
+    """
+    Process unread mail that arrived since the last sync. The first sync (or one
+    whose stored historyId has expired) falls back to listing all unread mail.
+    Messages that could not be fetched are saved with the historyId and retried
+    on the next sync, since history will not report them again.
+    """
+    start_time = time.time()
+    stats = {'http_requests': 0, 'api_calls': 0, 'messages': 0}
+    history_id, retry_ids = load_state()
+    msg_ids = None
+    if history_id is not None:
+        try:
+            msg_ids, latest_history_id = list_added_since(service, history_id, stats)
+        except HttpError as error:
+            if error.resp.status != 404:
+                raise
+            print('Stored historyId has expired, running a full sync')
+    if msg_ids is None:
+        # Read the mailbox's historyId first so mail arriving mid-sync is picked up next time
+        latest_history_id = service.users().getProfile(userId='me').execute()['historyId']
+        stats['http_requests'] += 1
+        stats['api_calls'] += 1
+        msg_ids = list_unread(service, stats)
+
+    msg_ids = list(dict.fromkeys(retry_ids + msg_ids))
+    messages, failed = fetch_messages(service, msg_ids, stats)
+    # History reports every added message; only unread ones are processed
+    unread = [messages[msg_id] for msg_id in msg_ids
+              if msg_id in messages and 'UNREAD' in messages[msg_id].get('labelIds', [])]
+    # Triage the whole sync at once so ambiguous emails share batched LLM prompts
+    llm_calls_before = email_triage.stats['llm_calls']
+    verdicts = email_triage.triage([extract_body(message) for message in unread])
+    stats['triage_llm_calls'] = email_triage.stats['llm_calls'] - llm_calls_before
+
+    processed = []
+    claims = []
+    for message, insurance_related in zip(unread, verdicts):
+        result = process_message(service, message, insurance_related)
+        if not result['keep_unread']:
+            processed.append(message['id'])
+        if result['claim']:
+            claims.append((message['id'], result['claim']))
+    mark_as_read(service, processed, stats)
+    # Forwarded only now, so a failed upload's mark_as_unread can't be overwritten by the batch above
+    for msg_id, pdfs in claims:
+        forward_claim(service, msg_id, pdfs)
+    save_state(latest_history_id, failed)
+
+    stats['messages'] = len(processed)
+    stats['fetch_failures'] = len(failed)
+    stats['seconds'] = round(time.time() - start_time, 2)
+    stats['api_calls_per_message'] = round(stats['api_calls'] / len(processed), 2) if processed else 0.0
+    print(f"Synced {len(processed)} messages: {stats}")
+    return processed
 
-def save_attachment(service, msg_id, attachment_id, filename):
+def main():
+    """Sync once, or every GMAIL_POLL_SECONDS when set, forwarding claims in the background."""
+    poll_seconds = float(os.getenv("GMAIL_POLL_SECONDS", "0"))
+    service = get_service()
+    try:
+        while True:
+            processed = []
+            try:
+                processed = sync(service)
+                if not processed:
+                    print('There were 0 results for that search string')
+            except HttpError as error:
+                # TODO(developer) - Handle errors from gmail API.
+                print(f'An error occurred: {error}')
+            if poll_seconds <= 0:
+                return processed
+            time.sleep(poll_seconds)
+    finally:
+        # Let queued uploads finish before the process exits
+        forwarder.close()
+        print(f"Forwarder: {forwarder.stats()}")
+
+def _thread_http(service):
+    """
+    An authorized Http for the calling thread. httplib2 connections are not
+    thread-safe, so each download worker needs its own.
+    """
+    http = getattr(_local, 'http', None)
+    if http is None:
+        http = AuthorizedHttp(service._http.credentials, http=httplib2.Http())
+        _local.http = http
+    return http
+
+def save_attachment(service, msg_id, part_id, attachment_id, filename):
+    """
+    Download an attachment into the content-addressed store unless this message
+    part was fetched before. The part ID is the stable key; Gmail hands out a new
+    attachment ID on every fetch. Returns `(path, sha256)`, or None on error.
+    """
+    stored = attachment_store.lookup(msg_id, part_id)
+    if stored is not None:
+        print(f"Already downloaded: {filename}")
+        return stored
     try:
         # Get the attachment
         attachment = service.users().messages().attachments().get(
             userId='me',
             messageId=msg_id,
             id=attachment_id
-        ).execute()
+        ).execute(http=_thread_http(service))
 
-        # Decode the attachment data
-        file_data = base64.urlsafe_b64decode(attachment['data'].encode('UTF-8'))
-        
-        # Create 'attachments' directory if it doesn't exist
-        if not os.path.exists('attachments'):
-            os.makedirs('attachments')
-            
-        # Save the attachment
-        filepath = os.path.join('attachments', filename)
-        with open(filepath, 'wb') as f:
-            f.write(file_data)
-        
-        print(f"Saved attachment: {filename}")
-        return filepath
+        path, sha256, is_new = attachment_store.save_base64(msg_id, part_id, filename, attachment['data'])
+        print(f"Saved attachment: {filename}" if is_new else f"Duplicate attachment: {filename}")
+        return path, sha256
     except HttpError as error:
         print(f'An error occurred while saving attachment: {error}')
         return None
 
 def is_insurance_related(text):
-    try:
-        prompt = "You are a helpful assistant that determines if an email is about an insurance claim. Analyze the following email and respond with ONLY 'yes' or 'no'. Email text: " + text
-        print(text)
-        # Use Cohere chat to determine if text is insurance-related
-        response = co.chat_stream(
-            
-            messages=[{"role": "user", "content": prompt}],
-            #preamble="You are an expert at identifying insurance claim related emails. You must respond with ONLY 'yes' or 'no', with no additional text or explanation.",
-            model="command-r-plus-08-2024",
-        )
-        summary = ""
-        for event in response:
-            if event.type == "content-delta":
-                summary += event.delta.message.content.text
-        print(summary)
-        return summary.strip().lower() == "yes"
-    except Exception as e:
-        print(f"Error in Cohere chat: {e}")
-        return False
-
-async def process_insurance_document(filepath):
-    try:
-        import aiohttp
-        import aiofiles
-        
-        async with aiofiles.open(filepath, 'rb') as f:
-            file_content = await f.read()
-            
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                'http://localhost:8000/upload',
-                data={'file': (os.path.basename(filepath), file_content, 'application/pdf')}
-            ) as response:
-                if response.status == 200:
-                    print(f"Successfully processed {filepath}")
-                    return await response.json()
-                else:
-                    print(f"Error processing {filepath}: {response.status}")
-                    return None
-    except Exception as e:
-        print(f"Error sending file to API: {e}")
-        return None
+    """Local prefilter first; only an ambiguous email costs an LLM call."""
+    return email_triage.triage([text])[0]
+
+def forward_claim(service, msg_id, pdfs):
+    """
+    Queue every PDF from one email as a single multi-file /upload call. This
+    returns once the upload is queued; the result is handled in the background,
+    and a claim that could not be uploaded puts its message back to unread.
+    """
+    def on_done(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Error sending message {msg_id} to API: {e}; leaving it unread")
+            mark_as_unread(service, msg_id)
+            return
+        attachment_store.mark_claim_processed(sha256 for _, sha256 in pdfs)
+        print(f"Processing result for message {msg_id}: {result}")
+
+    forwarder.submit([path for path, _ in pdfs]).add_done_callback(on_done)
+
+def walk_parts(part):
+    """Yield a message payload and all of its nested MIME parts."""
+    yield part
+    for child in part.get('parts', []):
+        yield from walk_parts(child)
+
+def decode_body(data):
+    return base64.urlsafe_b64decode(data.encode('ASCII')).decode('utf-8', errors='replace')
+
+def extract_body(message):
+    """The text/plain and text/html parts of a full-format message, concatenated."""
+    email_body = ""
+    for part in walk_parts(message['payload']):
+        body = part.get('body', {})
+        if part.get('mimeType') in ('text/html', 'text/plain') and not part.get('filename') and body.get('data'):
+            email_body += decode_body(body['data'])
+    return email_body
+
+def process_message(service, message, insurance_related=None):
+    """
+    Save a full-format message's attachments and pick out the claim to forward:
+    `claim` holds the `(path, sha256)` of its PDFs, or None. `keep_unread` is set
+    for a claim too large to upload. `insurance_related` is the triage verdict
+    when the caller already has one.
+    """
+    msg_id = message['id']
+    email_body = extract_body(message)
+    downloads = []
+
+    for part in walk_parts(message['payload']):
+        body = part.get('body', {})
+        # Attachments download concurrently
+        if part.get('filename') and 'attachmentId' in body:
+            downloads.append(attachment_pool.submit(
+                save_attachment, service, msg_id, part['partId'], body['attachmentId'], part['filename']
+            ))
+
+    # Check if email is insurance-related while the attachments download
+    if insurance_related is None:
+        insurance_related = is_insurance_related(email_body)
+    saved = [result for result in (future.result() for future in downloads) if result]
+    saved_attachments = [path for path, _ in saved]
+    keep_unread = False
+    claim = None
+
+    if insurance_related:
+        print("Insurance-related email detected, processing attachments...")
+        # The email's PDFs are one claim and are always sent together, so a resent
+        # form still reaches validation alongside new notes. Only a claim whose
+        # exact set of files was already processed is skipped.
+        pdfs = [(path, sha256) for path, sha256 in saved if path.lower().endswith('.pdf')]
+        sizes = [os.path.getsize(path) for path, _ in pdfs]
+        claim_bytes = sum(sizes)
+        if pdfs and attachment_store.is_claim_processed(sha256 for _, sha256 in pdfs):
+            print(f"Claim in message {msg_id} was already processed")
+        elif (len(pdfs) > MAX_REQUEST_FILES or claim_bytes > MAX_REQUEST_BYTES
+              or max(sizes, default=0) > MAX_UPLOAD_BYTES):
+            # /upload would refuse it (413); splitting would validate the files apart
+            print(f"Claim in message {msg_id} has {len(pdfs)} PDFs ({claim_bytes} bytes), over /upload's "
+                  f"limits ({MAX_REQUEST_FILES} files, {MAX_REQUEST_BYTES} bytes, {MAX_UPLOAD_BYTES} per file); "
+                  f"leaving it unread")
+            keep_unread = True
+        elif pdfs:
+            claim = pdfs
+
+    return {
+        'body': email_body,
+        'attachments': saved_attachments,
+        'claim': claim,
+        'keep_unread': keep_unread,
+    }
 
 def get_message(service, msg_id):
     try:
-        message_list = service.users().messages().get(userId='me', id=msg_id, format='raw').execute()
-        msg_raw = base64.urlsafe_b64decode(message_list['raw'].encode('ASCII'))
-        msg_str = email.message_from_bytes(msg_raw)
-        
-        # Get full message details for attachments
-        message_detail = service.users().messages().get(userId='me', id=msg_id).execute()
-        
-        content_types = msg_str.get_content_maintype()
-        saved_attachments = []
-        email_body = ""
-        
-        if content_types == 'multipart':
-            parts = msg_str.get_payload()
-            for part in parts:
-                content_type = part.get_content_type()
-                
-                # Handle text content first
-                if content_type == 'text/html' or content_type == 'text/plain':
-                    payload = part.get_payload()
-                    if isinstance(payload, str):  # Direct string payload
-                        if part.get('Content-Transfer-Encoding') == 'base64':
-                            payload = base64.b64decode(payload).decode('utf-8')
-                        email_body += payload
-                
-                # Then handle attachments
-                if part.get_filename():
-                    for payload in message_detail['payload'].get('parts', []):
-                        if payload.get('filename') == part.get_filename():
-                            if 'body' in payload and 'attachmentId' in payload['body']:
-                                attachment_id = payload['body']['attachmentId']
-                                filepath = save_attachment(service, msg_id, attachment_id, part.get_filename())
-                                if filepath:
-                                    saved_attachments.append(filepath)
-        else:
-            payload = msg_str.get_payload()
-            if msg_str.get('Content-Transfer-Encoding') == 'base64':
-                payload = base64.b64decode(payload).decode('utf-8')
-            email_body = payload
-        
-        # Check if email is insurance-related
-        if is_insurance_related(email_body):
-            print("Insurance-related email detected, processing attachments...")
-            import asyncio
-            for attachment_path in saved_attachments:
-                if attachment_path.lower().endswith('.pdf'):
-                    # Process the PDF through your FastAPI endpoint
-                    result = asyncio.run(process_insurance_document(attachment_path))
-                    print(f"Processing result: {result}")
-        
-        return {
-            'body': email_body,
-            'attachments': saved_attachments,
-        }
-
+        message = service.users().messages().get(userId='me', id=msg_id, format='full').execute()
+        result = process_message(service, message)
+        if result['claim']:
+            forward_claim(service, msg_id, result['claim'])
+        return result
     except HttpError as error:
         print(f'An error occurred: {error}')
         return None
 
-
 if __name__ == '__main__':
     main()
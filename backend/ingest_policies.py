@@ -0,0 +1,137 @@
+"""
+Index a corpus of policy contracts and riders into the policy vector database.
+
+Usage (from backend/):
+    python ingest_policies.py policies/
+    python ingest_policies.py "policies/**/*.pdf" --parse-workers 4 --embed-workers 4
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from insurance_policy_rag import file_sha256, index_document, mirror_local_index, parse_pdf
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_documents(source):
+    """Expand a directory (searched recursively) or a glob into a sorted list of PDFs."""
+    if os.path.isdir(source):
+        source = os.path.join(source, "**", "*.pdf")
+    return sorted(path for path in glob.glob(source, recursive=True) if path.lower().endswith(".pdf"))
+
+
+def document_metadata(pdf_file_path, root):
+    """
+    Tags used for filtered retrieval. The policy ID is the document's folder under
+    the corpus root (so a contract and its riders share it), or the file name for
+    documents at the top level.
+    """
+    name = os.path.basename(pdf_file_path)
+    relative_dir = os.path.relpath(os.path.dirname(os.path.abspath(pdf_file_path)), root)
+    policy_id = os.path.splitext(name)[0] if relative_dir == "." else relative_dir.split(os.sep)[0]
+    return {
+        "policy_id": policy_id,
+        "document": name,
+        "document_type": "rider" if "rider" in name.lower() else "policy",
+        "document_sha256": file_sha256(pdf_file_path),
+    }
+
+
+def timed_parse(pdf_file_path):
+    # Runs in a worker process; LlamaParse results are cached on disk by content hash
+    start = time.time()
+    texts = parse_pdf(pdf_file_path)
+    return texts, round(time.time() - start, 3)
+
+
+def ingest(source, parse_workers, embed_workers, summary_path):
+    documents = find_documents(source)
+    if not documents:
+        print(f"No PDFs found for {source}")
+        return None
+
+    root = source if os.path.isdir(source) else os.path.commonpath(
+        [os.path.dirname(os.path.abspath(path)) for path in documents]
+    )
+    root = os.path.abspath(root)
+    start_time = time.time()
+    summary = {"source": source, "documents": {}}
+    results = []
+
+    print(f"Ingesting {len(documents)} documents "
+          f"({parse_workers} parse processes, {embed_workers} embed workers)")
+    # Parsing is CPU/IO heavy and independent per document, so it runs in processes;
+    # each parsed document is handed to a bounded thread pool for chunk/embed/upsert.
+    with ProcessPoolExecutor(max_workers=parse_workers) as parsers, \
+            ThreadPoolExecutor(max_workers=embed_workers) as embedders:
+        parse_futures = {parsers.submit(timed_parse, path): path for path in documents}
+        index_futures = {}
+        for future in as_completed(parse_futures):
+            path = parse_futures[future]
+            try:
+                texts, parse_seconds = future.result()
+            except Exception as e:
+                summary["documents"][path] = {"status": "failed", "stage": "parse", "error": str(e)}
+                continue
+            summary["documents"][path] = {"parse_seconds": parse_seconds}
+            metadata = document_metadata(path, root)
+            # Keyed by the path under the corpus root, so same-named files in different
+            # policy folders (e.g. two contract.pdf) keep separate manifests and IDs
+            document_key = os.path.relpath(os.path.abspath(path), root).replace(os.sep, "/")
+            index_futures[embedders.submit(index_document, path, texts, metadata, False, document_key)] = path
+
+        for future in as_completed(index_futures):
+            path = index_futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["documents"][path].update({"status": "failed", "stage": "index", "error": str(e)})
+                continue
+            results.append(result)
+            summary["documents"][path].update({
+                "status": "ok",
+                **{key: value for key, value in result.items() if key not in ("ids", "new_records")},
+            })
+            print(f"{os.path.basename(path)}: {result['chunks']} chunks, {result['embedded']} embedded, "
+                  f"{result['deleted']} deleted in {result['seconds']:.2f} sec")
+
+    if results:
+        mirror_local_index(results)
+
+    elapsed = time.time() - start_time
+    embedded = sum(result["embedded"] for result in results)
+    summary.update({
+        "total_documents": len(documents),
+        "indexed_documents": len(results),
+        "failed_documents": len(documents) - len(results),
+        "chunks": sum(result["chunks"] for result in results),
+        "embedded": embedded,
+        "deleted": sum(result["deleted"] for result in results),
+        "seconds": round(elapsed, 3),
+        "chunks_per_second": round(embedded / elapsed, 2) if elapsed > 0 else 0.0,
+    })
+    os.makedirs(os.path.dirname(os.path.abspath(summary_path)), exist_ok=True)
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"Indexed {len(results)}/{len(documents)} documents in {elapsed:.2f} sec; summary: {summary_path}")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Directory of PDFs or a glob pattern")
+    parser.add_argument("--parse-workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--embed-workers", type=int, default=4)
+    parser.add_argument("--summary", default=os.path.join(
+        CURRENT_DIR, ".cache", "ingest_runs", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    ))
+    args = parser.parse_args()
+    ingest(args.source, args.parse_workers, args.embed_workers, args.summary)
+
+
+if __name__ == "__main__":
+    main()
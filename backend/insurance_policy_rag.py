@@ -1,14 +1,20 @@
+import hashlib
 import json
+import queue
 import sys
+import threading
 from pinecone import Pinecone
 import os
 from dotenv import load_dotenv
 import time
+from urllib.parse import quote
 from llama_cloud_services import LlamaParse
 from llama_index.core import SimpleDirectoryReader
 from llama_index.core.text_splitter import TokenTextSplitter
 from tqdm import tqdm
-import cohere
+
+import cohere_clients
+from vector_index import load_local_records, query_index, save_local_index, sync_from_pinecone
 
 load_dotenv()
 
@@ -27,11 +33,12 @@ def generate_response(user_input):
         parameters={"input_type": "query"}
     )
 
-    # Step 2: Search Pinecone for relevant data
-    search_results = index.query(
+    # Step 2: Search the policy index (Pinecone or the local copy) for relevant data
+    search_results = query_index(
+        index,
         namespace="insurance_policy",
         vector=embeddings.get("data")[0]["values"],
-        top_k=3, 
+        top_k=3,
         include_metadata=True
     )
 
@@ -60,8 +67,7 @@ def generate_response(user_input):
     # Step 4: Pass Context + Query to LLaMA
     prompt = f"Context: {context}\n\nQuestion: {user_input}\nAnswer:"
     
-    co = cohere.ClientV2()
-    response = co.chat_stream(
+    response = cohere_clients.get_client().chat_stream(
         model="command-r-plus-08-2024",
         messages=[{"role": "user", "content": prompt}],
     )
@@ -69,17 +75,32 @@ def generate_response(user_input):
     print(f"Response Generation Time: {time.time() - start_time:.2f} sec")
 
     # Step 5: Display Response
-    for line in response.iter_lines():
-        if line:
-            try:
-                json_data = json.loads(line)
-                sys.stdout.write(json_data.get('response', ''))
-                sys.stdout.flush() 
-            except json.JSONDecodeError:
-                print("Warning: Received invalid JSON chunk. Skipping...")
+    for event in response:
+        if event.type == "content-delta":
+            sys.stdout.write(event.delta.message.content.text)
+            sys.stdout.flush()
     print(f"Display Generation Time: {time.time() - start_time:.2f} sec")
 
-def generate_vector_database(pdf_file_path):
+NAMESPACE = "insurance_policy"
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSE_CACHE_DIR = os.path.join(CURRENT_DIR, ".cache", "llamaparse")
+MANIFEST_DIR = os.path.join(CURRENT_DIR, ".cache", "index_manifest")
+EMBED_BATCH_SIZE = 10
+UPSERT_BATCH_SIZE = 50
+
+def file_sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def parse_pdf(pdf_file_path):
+    """LlamaParse the PDF to markdown, cached by the file's content hash."""
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{file_sha256(pdf_file_path)}.json")
+    if os.path.exists(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return json.load(f)
 
     parser = LlamaParse(
         api_key=os.getenv("LLAMAPARSE_API_KEY"),
@@ -88,52 +109,184 @@ def generate_vector_database(pdf_file_path):
 
     file_extractor = {".pdf": parser}
     documents = SimpleDirectoryReader(input_files=[pdf_file_path], file_extractor=file_extractor).load_data()
+    texts = [doc.text for doc in documents]
+
+    os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+    with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(texts, f)
+    os.replace(cache_path + ".tmp", cache_path)
+    return texts
 
+def chunk_texts(texts):
     splitter = TokenTextSplitter(separator=" ", chunk_size=300, chunk_overlap=50)
+    return [chunk for text in texts for chunk in splitter.split_text(text)]
 
-    records = []
-    chunk_count = 0
+def chunk_id(document_key, chunk_text, metadata=None):
+    # Content-addressed, so an unchanged chunk keeps its ID when others move around it.
+    # Extra metadata is part of the key so retagging a document re-upserts its chunks.
+    key = chunk_text if not metadata else chunk_text + "\0" + json.dumps(metadata, sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return f"{document_key}_{digest[:24]}"
 
-    print("Splitting documents and embedding in batches...")
+def manifest_path(document_key):
+    # Keys may contain path separators (e.g. "POL123/contract.pdf"), so they are escaped
+    return os.path.join(MANIFEST_DIR, NAMESPACE, f"{quote(document_key, safe='')}.json")
 
-    for doc in tqdm(documents, desc="Processing documents"):
-        chunks = splitter.split_text(doc.text)
+def load_manifest(document_key):
+    try:
+        with open(manifest_path(document_key), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
-        batch_size = 10
-        for i in range(0, len(chunks), batch_size):
-            batch = chunks[i:i + batch_size]
+def save_manifest(document_key, pdf_file_path, ids):
+    path = manifest_path(document_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"source_file": pdf_file_path, "ids": sorted(ids)}, f)
+    os.replace(path + ".tmp", path)
 
-            # Embed this batch
+def embed_and_upsert(pending, namespace=NAMESPACE, queue_size=4, progress=True):
+    """
+    Embed `(id, chunk_text, metadata)` items and upsert them, overlapping the two:
+    the caller's thread embeds batches while a writer thread upserts the previous
+    ones through a bounded queue. Returns the upserted records.
+    """
+    upserts = queue.Queue(maxsize=queue_size)
+    done = []
+    errors = []
+
+    def writer():
+        batch = []
+        while True:
+            records = upserts.get()
+            if records is not None:
+                batch.extend(records)
+            if batch and (records is None or len(batch) >= UPSERT_BATCH_SIZE):
+                try:
+                    index.upsert(vectors=batch, namespace=namespace)
+                    done.extend(batch)
+                except Exception as e:
+                    errors.append(e)
+                batch = []
+            if records is None:
+                return
+
+    upserter = threading.Thread(target=writer, name="pinecone-upsert")
+    upserter.start()
+    try:
+        for i in tqdm(range(0, len(pending), EMBED_BATCH_SIZE), desc="Embedding chunks", disable=not progress):
+            if errors:
+                break
+            batch = pending[i:i + EMBED_BATCH_SIZE]
             embedding_response = pc.inference.embed(
                 model= "multilingual-e5-large",
-                inputs=batch,
+                inputs=[chunk_text for _, chunk_text, _ in batch],
                 parameters={"input_type": "query"}
             )
             embeddings = embedding_response.get("data")
+            upserts.put([
+                {"id": vector_id, "values": emb["values"], "metadata": metadata}
+                for emb, (vector_id, _, metadata) in zip(embeddings, batch)
+            ])
+    finally:
+        upserts.put(None)
+        upserter.join()
+    if errors:
+        raise errors[0]
+    return done
+
+def index_document(pdf_file_path, texts=None, metadata=None, progress=True, document_key=None):
+    """
+    Incrementally index one policy PDF: only chunks whose content is new are embedded
+    and upserted, and chunks that disappeared from the document are deleted.
+    `texts` skips parsing when the caller already has the markdown; `metadata` is
+    added to every record for filtered retrieval. `document_key` identifies the
+    document's manifest and chunk IDs and must be unique across the corpus; it
+    defaults to the file name.
+    """
+    start_time = time.time()
+    if document_key is None:
+        document_key = os.path.basename(pdf_file_path)
+    if texts is None:
+        texts = parse_pdf(pdf_file_path)
+    chunks = chunk_texts(texts)
+
+    current = {}
+    for chunk_text in chunks:
+        current.setdefault(chunk_id(document_key, chunk_text, metadata), chunk_text)
+
+    manifest = load_manifest(document_key)
+    if manifest is None:
+        # First incremental run: drop any positional IDs written by older versions,
+        # which were only ever keyed by file name
+        previous = set()
+        if document_key == os.path.basename(pdf_file_path):
+            legacy_prefix = f"{document_key}_chunk_"
+            previous = {vector_id for ids in index.list(prefix=legacy_prefix, namespace=NAMESPACE) for vector_id in ids}
+    else:
+        previous = set(manifest["ids"])
+
+    stale = sorted(previous - current.keys())
+    pending = [
+        (vector_id, chunk_text, {**(metadata or {}), "source_file": pdf_file_path, "content": chunk_text})
+        for vector_id, chunk_text in current.items() if vector_id not in previous
+    ]
+
+    embed_start = time.time()
+    new_records = embed_and_upsert(pending, progress=progress)
+    embed_elapsed = time.time() - embed_start
+
+    for i in range(0, len(stale), 1000):
+        index.delete(ids=stale[i:i + 1000], namespace=NAMESPACE)
+    save_manifest(document_key, pdf_file_path, current.keys())
+
+    return {
+        "source_file": pdf_file_path,
+        "ids": list(current),
+        "new_records": new_records,
+        "chunks": len(current),
+        "embedded": len(new_records),
+        "unchanged": len(current) - len(pending),
+        "deleted": len(stale),
+        "embed_seconds": round(embed_elapsed, 3),
+        "seconds": round(time.time() - start_time, 3),
+    }
+
+def mirror_local_index(results):
+    """
+    Rebuild the local index after `index_document` runs: other documents and the
+    indexed documents' unchanged chunks are kept, new records are added.
+    """
+    current = {vector_id for result in results for vector_id in result["ids"]}
+    indexed = {result["source_file"] for result in results}
+    local_records = {
+        vector_id: record for vector_id, record in load_local_records(NAMESPACE).items()
+        if record["metadata"].get("source_file") not in indexed or vector_id in current
+    }
+    for result in results:
+        local_records.update({record["id"]: record for record in result["new_records"]})
+    missing = [vector_id for vector_id in current if vector_id not in local_records]
+    for i in range(0, len(missing), 100):
+        fetched = index.fetch(ids=missing[i:i + 100], namespace=NAMESPACE)
+        for vector_id, vector in fetched.vectors.items():
+            local_records[vector_id] = {"id": vector_id, "values": vector.values, "metadata": vector.metadata or {}}
+    save_local_index(NAMESPACE, list(local_records.values()))
+
+def generate_vector_database(pdf_file_path):
+    result = index_document(pdf_file_path)
+    mirror_local_index([result])
+
+    rate = result["embedded"] / result["embed_seconds"] if result["embedded"] and result["embed_seconds"] > 0 else 0.0
+    print(f"{result['chunks']} chunks: {result['embedded']} new, {result['deleted']} stale, "
+          f"{result['unchanged']} unchanged")
+    print(f"Completed indexing in {result['seconds']:.2f} sec. "
+          f"Embedded {result['embedded']} chunks at {rate:.1f} chunks/sec, deleted {result['deleted']}")
 
-            # Create Pinecone records
-            for emb, chunk_text in zip(embeddings, batch):
-                record = {
-                    "id": f"{os.path.basename(pdf_file_path)}_chunk_{chunk_count}",
-                    "values": emb["values"],
-                    "metadata": {
-                        "source_file": pdf_file_path,
-                        "content": chunk_text
-                    }
-                }
-                records.append(record)
-                chunk_count += 1
-
-            # Upsert every 50 records to Pinecone (tweak this as needed)
-            if len(records) >= 50:
-                index.upsert(vectors=records, namespace="insurance_policy")
-                records = []
-
-    # Upsert remaining records
-    if records:
-        index.upsert(vectors=records, namespace="insurance_policy")
-
-    print(f"Completed indexing. Total chunks embedded: {chunk_count}")
+def sync_local_index():
+    # Rebuild the local vector index from what is already in Pinecone
+    count = sync_from_pinecone(index, NAMESPACE)
+    print(f"Copied {count} vectors into the local index")
 
 def main():
     generate_vector_database("/Users/savit/Desktop/Code/genai_genesis/backend/sample-policy-contract.pdf")
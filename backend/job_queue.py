@@ -0,0 +1,337 @@
+import asyncio
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple, Union
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    files TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+"""
+
+
+class QueueFull(Exception):
+    pass
+
+
+# A job handler receives the stored file paths and a progress callback, returns the result
+JobHandler = Callable[[List[Tuple[str, str]], Callable[[dict], None]], Awaitable[dict]]
+
+
+class JobQueue:
+    """
+    Durable claim queue backed by SQLite, with uploaded files kept on disk so
+    queued jobs survive restarts. Workers are asyncio tasks in the app process;
+    several app processes (e.g. uvicorn workers) may share the queue. A running
+    job holds a lease its process renews with heartbeats, and only jobs whose
+    lease has expired are handed back to the queue.
+    """
+
+    def __init__(self, db_path: str, files_dir: str, max_depth: int, workers: int, retention_s: float,
+                 lease_s: float):
+        self.db_path = db_path
+        self.files_dir = files_dir
+        self.max_depth = max_depth
+        self.workers = workers
+        self.retention_s = retention_s
+        self.lease_s = lease_s
+        # Jobs this process is running, whose leases its heartbeat renews
+        self._running = set()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        # Workers' SQLite calls run here instead of on the event loop; a single
+        # thread keeps a job's progress and final writes in order
+        self._db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jobs-db")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)")]
+            if "heartbeat_at" not in columns:
+                # Databases created before leases existed
+                conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+            self._conn = conn
+        return self._conn
+
+    def depth(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+
+    def enqueue(self, files: List[Tuple[str, Union[bytes, memoryview]]]) -> str:
+        """Store `(filename, content)` pairs and queue a job for them. Raises QueueFull."""
+        # Cheap early refusal; the authoritative check is in the insert transaction
+        if self.depth() >= self.max_depth:
+            raise QueueFull(f"Job queue is full ({self.max_depth} queued)")
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.files_dir, job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        stored = []
+        try:
+            for index, (filename, content) in enumerate(files):
+                path = os.path.join(job_dir, f"{index}.pdf")
+                with open(path, "wb") as f:
+                    f.write(content)
+                stored.append([filename, path])
+
+            with self._lock:
+                conn = self.conn
+                # Counting and inserting in one IMMEDIATE transaction keeps concurrent
+                # enqueues from both passing the check and overfilling the queue
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    depth = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                    if depth >= self.max_depth:
+                        raise QueueFull(f"Job queue is full ({self.max_depth} queued)")
+                    conn.execute(
+                        "INSERT INTO jobs (id, status, created_at, files, progress) VALUES (?, ?, ?, ?, ?)",
+                        (job_id, QUEUED, time.time(), json.dumps(stored), json.dumps({"stage": QUEUED})),
+                    )
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        if self._loop is not None:
+            # enqueue runs off the event loop, and asyncio.Event is not thread-safe
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        with self._lock:
+            conn = self.conn
+            # IMMEDIATE takes the write lock up front so two workers never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    now = time.time()
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ?, heartbeat_at = ?, progress = ? WHERE id = ?",
+                        (RUNNING, now, now, json.dumps({"stage": RUNNING}), row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            return row
+
+    def _update(self, job_id: str, **columns) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in columns)
+        with self._lock:
+            self.conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*columns.values(), job_id))
+
+    def _heartbeat(self, job_ids: List[str]) -> int:
+        """Renew the leases of `job_ids`, then re-queue running jobs whose lease has expired."""
+        now = time.time()
+        with self._lock:
+            if job_ids:
+                placeholders = ", ".join("?" for _ in job_ids)
+                self.conn.execute(
+                    f"UPDATE jobs SET heartbeat_at = ? WHERE status = ? AND id IN ({placeholders})",
+                    (now, RUNNING, *job_ids),
+                )
+        return self._requeue_expired()
+
+    def _requeue_expired(self) -> int:
+        """Hand jobs whose process stopped heartbeating (e.g. crashed) back to the front of the queue."""
+        cutoff = time.time() - self.lease_s
+        with self._lock:
+            return self.conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, heartbeat_at = NULL, progress = ? "
+                "WHERE status = ? AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                (QUEUED, json.dumps({"stage": QUEUED}), RUNNING, cutoff),
+            ).rowcount
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = {
+            "id": row["id"],
+            "status": row["status"],
+            "files": [filename for filename, _ in json.loads(row["files"])],
+            "progress": json.loads(row["progress"]) if row["progress"] else None,
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+        }
+        if row["status"] == QUEUED:
+            job["position"] = self._position(row["created_at"])
+        return job
+
+    def purge(self) -> int:
+        """Delete finished jobs older than the retention period; returns how many were removed."""
+        cutoff = time.time() - self.retention_s
+        with self._lock:
+            ids = [row[0] for row in self.conn.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+            )]
+            self.conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (DONE, FAILED, cutoff)
+            )
+        for job_id in ids:
+            # Normally already removed when the job finished
+            shutil.rmtree(os.path.join(self.files_dir, job_id), ignore_errors=True)
+        return len(ids)
+
+    def _position(self, created_at: float) -> int:
+        with self._lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < ?", (QUEUED, created_at)
+            ).fetchone()[0] + 1
+
+    def metrics(self, window: int = 100) -> dict:
+        """Queue depth and wait times (queued -> started) to size the worker pool."""
+        now = time.time()
+        with self._lock:
+            counts = dict(self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = self.conn.execute(
+                "SELECT MIN(created_at) FROM jobs WHERE status = ?", (QUEUED,)
+            ).fetchone()[0]
+            waits = [row[0] for row in self.conn.execute(
+                "SELECT started_at - created_at FROM jobs WHERE started_at IS NOT NULL "
+                "ORDER BY started_at DESC LIMIT ?", (window,)
+            )]
+            runs = [row[0] for row in self.conn.execute(
+                "SELECT finished_at - started_at FROM jobs WHERE finished_at IS NOT NULL "
+                "ORDER BY finished_at DESC LIMIT ?", (window,)
+            )]
+        waits.sort()
+        return {
+            "workers": self.workers,
+            "max_depth": self.max_depth,
+            "depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "done": counts.get(DONE, 0),
+            "failed": counts.get(FAILED, 0),
+            "oldest_queued_age_s": round(now - oldest, 3) if oldest else 0.0,
+            "wait_s_mean": round(sum(waits) / len(waits), 3) if waits else 0.0,
+            "wait_s_p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0.0,
+            "run_s_mean": round(sum(runs) / len(runs), 3) if runs else 0.0,
+        }
+
+    def _run_db(self, func, *args, **kwargs) -> asyncio.Future:
+        return self._loop.run_in_executor(self._db, lambda: func(*args, **kwargs))
+
+    async def _worker(self, handler: JobHandler) -> None:
+        while True:
+            row = await self._run_db(self._claim)
+            if row is None:
+                self._wakeup.clear()
+                try:
+                    # Poll as well, so a wakeup set between claim and clear is never lost
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id = row["id"]
+            files = [tuple(entry) for entry in json.loads(row["files"])]
+            self._running.add(job_id)
+
+            def progress(update: dict, job_id=job_id) -> None:
+                # Called from the event loop: queue the write without waiting for it
+                self._run_db(self._update, job_id, progress=json.dumps({"stage": RUNNING, **update}))
+
+            finished = False
+            try:
+                result = await handler(files, progress)
+                await self._run_db(self._update, job_id, status=DONE, finished_at=time.time(),
+                                   progress=json.dumps({"stage": DONE}), result=json.dumps(result, default=str))
+                finished = True
+            except asyncio.CancelledError:
+                # Shutdown mid-job: hand it back to the queue for the next start. Written
+                # synchronously, since the loop may not run another callback.
+                self._update(job_id, status=QUEUED, started_at=None, heartbeat_at=None,
+                             progress=json.dumps({"stage": QUEUED}))
+                raise
+            except Exception as e:
+                await self._run_db(self._update, job_id, status=FAILED, finished_at=time.time(),
+                                   progress=json.dumps({"stage": FAILED}), error=str(e))
+                finished = True
+            finally:
+                self._running.discard(job_id)
+                if finished:
+                    shutil.rmtree(os.path.join(self.files_dir, job_id), ignore_errors=True)
+
+    async def _purge_periodically(self, interval: float = 3600.0) -> None:
+        while True:
+            removed = await self._run_db(self.purge)
+            if removed:
+                print(f"Purged {removed} finished jobs")
+            await asyncio.sleep(interval)
+
+    async def _heartbeat_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_s / 3)
+            if await self._run_db(self._heartbeat, list(self._running)):
+                self._wakeup.set()
+
+    def start(self, handler: JobHandler) -> None:
+        # Jobs still running in another live process keep their lease and are left alone
+        requeued = self._requeue_expired()
+        if requeued:
+            print(f"Re-queued {requeued} jobs with expired leases")
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.ensure_future(self._worker(handler)) for _ in range(self.workers)]
+        self._tasks.append(asyncio.ensure_future(self._purge_periodically()))
+        self._tasks.append(asyncio.ensure_future(self._heartbeat_periodically()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+
+job_queue = JobQueue(
+    db_path=os.getenv("JOBS_DB", os.path.join(CURRENT_DIR, ".cache", "jobs", "jobs.sqlite")),
+    files_dir=os.getenv("JOBS_FILES_DIR", os.path.join(CURRENT_DIR, ".cache", "jobs", "files")),
+    max_depth=int(os.getenv("JOBS_MAX_DEPTH", "100")),
+    workers=int(os.getenv("JOBS_WORKERS", "2")),
+    # Finished jobs (and their results) are kept this long for polling clients
+    retention_s=float(os.getenv("JOBS_RETENTION_HOURS", "168")) * 3600,
+    # A running job whose process hasn't heartbeated for this long is re-queued
+    lease_s=float(os.getenv("JOBS_LEASE_SECONDS", "60")),
+)
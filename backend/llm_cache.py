@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Optional, Union
+
+import tracing
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires_at);
+"""
+
+Prompt = Union[str, list]
+
+
+def canonicalize(prompt: Prompt) -> str:
+    """
+    Prompt text with indentation and runs of whitespace collapsed, so prompts
+    built from differently indented templates still share an entry. Chat
+    message lists are canonicalized message by message.
+    """
+    if isinstance(prompt, str):
+        return " ".join(prompt.split())
+    return json.dumps(
+        [{**message, "content": canonicalize(message.get("content", ""))} for message in prompt],
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+
+
+class LLMCache:
+    """
+    Durable cache of LLM completions in SQLite, keyed by model, canonical prompt
+    and generation parameters. Entries expire after `ttl` seconds, and the least
+    recently used ones are evicted when the stored text exceeds `max_bytes`.
+    The database is shared by every worker process on the host.
+    """
+
+    def __init__(self, db_path: str, ttl: float, max_bytes: int):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._size: Optional[int] = None
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self.evictions = 0
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def key(model: str, prompt: Prompt, params: Optional[dict] = None) -> str:
+        parts = [model, canonicalize(prompt), json.dumps(params or {}, sort_keys=True)]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, namespace: str = "default") -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT response FROM responses WHERE key = ? AND expires_at > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                self.misses[namespace] += 1
+                tracing.mark_cache(False)
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits[namespace] += 1
+            tracing.mark_cache(True)
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            try:
+                old = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, model, response, size, now, now + self.ttl, now),
+                )
+            except sqlite3.Error as e:
+                print(f"LLM cache write failed: {e}")
+                return
+            if self._size is None:
+                self._size = self._stored_size()
+            else:
+                self._size += size - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict(now)
+
+    def _stored_size(self) -> int:
+        return self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict(self, now: float) -> None:
+        # Expired entries go first, then the least recently used until under 90% of the budget
+        deleted = self.conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,)).rowcount
+        self._size = self._stored_size()
+        target = int(self.max_bytes * 0.9)
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if self._size <= target:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._size -= size
+            deleted += 1
+        self.evictions += deleted
+
+    async def acomplete(self, namespace: str, model: str, prompt: Prompt, params: Optional[dict],
+                        call: Callable[[], Awaitable[str]]) -> str:
+        """
+        Return `call()`'s completion for this prompt, served from cache when
+        possible. SQLite work runs off the event loop.
+        """
+        key = self.key(model, prompt, params)
+        response = await asyncio.to_thread(self.get, key, namespace)
+        if response is None:
+            response = await call()
+            if response:
+                await asyncio.to_thread(self.put, key, model, response)
+        return response
+
+    async def astream(self, namespace: str, model: str, prompt: Prompt, params: Optional[dict],
+                      call: Callable[[], AsyncIterable[str]]) -> AsyncIterator[str]:
+        """
+        Yield the completion's text deltas. Hits replay the cached text word by
+        word; misses pass `call()`'s deltas through and are stored only once the
+        stream has finished.
+        """
+        key = self.key(model, prompt, params)
+        response = await asyncio.to_thread(self.get, key, namespace)
+        if response is not None:
+            for piece in re.findall(r"\s*\S+\s*", response) or [response]:
+                yield piece
+            return
+
+        pieces = []
+        async for delta in call():
+            pieces.append(delta)
+            yield delta
+        if pieces:
+            await asyncio.to_thread(self.put, key, model, "".join(pieces))
+
+    def stats(self) -> dict:
+        with self._lock:
+            if self._size is None:
+                self._size = self._stored_size()
+            namespaces = sorted(set(self.hits) | set(self.misses))
+            by_namespace = {}
+            for namespace in namespaces:
+                lookups = self.hits[namespace] + self.misses[namespace]
+                by_namespace[namespace] = {
+                    "hits": self.hits[namespace],
+                    "misses": self.misses[namespace],
+                    "hit_rate": round(self.hits[namespace] / lookups, 4) if lookups else 0.0,
+                }
+            hits = sum(self.hits.values())
+            lookups = hits + sum(self.misses.values())
+            return {
+                "hits": hits,
+                "misses": lookups - hits,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0],
+                "bytes": self._size,
+                "by_namespace": by_namespace,
+            }
+
+
+llm_cache = LLMCache(
+    db_path=os.getenv("LLM_CACHE_DB", os.path.join(CURRENT_DIR, ".cache", "llm_cache.sqlite3")),
+    ttl=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600,
+    max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024),
+)
@@ -0,0 +1,182 @@
+"""
+Classify claim PDFs locally where the PDF structure settles it, otherwise ask
+Document AI.
+
+Only fillable AcroForms are trusted to skip the remote classifier. Guesses for
+typed and scanned documents are compared against the remote label instead
+(shown in /classifier/stats) and can be measured offline on labelled PDFs laid
+out as `<dir>/<label>/*.pdf`:
+    python local_classifier.py evaluate labelled_pdfs/ [--remote]
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import threading
+from collections import Counter
+from typing import Callable, Optional, Tuple
+
+from DocumentAIClassifier import document_classifier
+from documents import count_pdf_pages, inflate_streams
+
+# Label used for locally classified fillable forms. Anything other than
+# "written_notes" is routed to the form parser, same as the remote classifier.
+FORM = "form"
+WRITTEN_NOTES = "written_notes"
+
+CONFIDENCE_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.8"))
+
+# Fillable fields only: a signature field alone is common on scanned notes
+_FIELD_RE = re.compile(rb"/FT\s*/(?:Tx|Btn|Ch)\b")
+_IMAGE_RE = re.compile(rb"/Subtype\s*/Image\b")
+_TEXT_OP_RE = re.compile(rb"[)\]>]\s*(?:Tj|TJ|'|\")")
+
+
+def inspect_pdf(content: bytes) -> dict:
+    """
+    Count the structural features of a PDF that separate forms, typed documents
+    and image-only scans, without a PDF library.
+    """
+    decoded = inflate_streams(content)
+    scanned = content + b"".join(decoded)
+    return {
+        "acroform": b"/AcroForm" in scanned,
+        "form_fields": len(_FIELD_RE.findall(scanned)),
+        "images": len(_IMAGE_RE.findall(scanned)),
+        "pages": count_pdf_pages(content, decoded),
+        "text_ops": sum(len(_TEXT_OP_RE.findall(data)) for data in decoded),
+    }
+
+
+def classify_locally(content: bytes) -> Tuple[Optional[str], float]:
+    """Return a (label, confidence) guess; label is None when the PDF gives no signal."""
+    if not content.startswith(b"%PDF"):
+        return None, 0.0
+
+    features = inspect_pdf(content)
+    text_per_page = features["text_ops"] / features["pages"]
+
+    # Fillable AcroForm fields are the strongest signal for the form parser
+    if features["acroform"] and features["form_fields"] > 0:
+        return FORM, 0.97
+    # Typed documents without AcroForm fields can still be forms (printed or
+    # flattened ones), and image-only scans can be either. These guesses stay
+    # below the threshold until their agreement with Document AI is measured.
+    if text_per_page >= 50:
+        return WRITTEN_NOTES, 0.5
+    if features["images"] > 0:
+        return WRITTEN_NOTES, 0.4
+    return None, 0.0
+
+
+def _routes_to_ocr(label: str) -> bool:
+    # Only written_notes goes to plain OCR; every other label goes to the form parser
+    return label == WRITTEN_NOTES
+
+
+class ClassifierStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local = 0
+        self.remote = 0
+        # Untrusted local guesses checked against the remote label, per guessed label
+        self.compared = Counter()
+        self.agreed = Counter()
+
+    def record(self, local: bool) -> None:
+        with self._lock:
+            if local:
+                self.local += 1
+            else:
+                self.remote += 1
+
+    def record_agreement(self, guess: str, remote_label: str) -> None:
+        with self._lock:
+            self.compared[guess] += 1
+            if _routes_to_ocr(guess) == _routes_to_ocr(remote_label):
+                self.agreed[guess] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.local + self.remote
+            return {
+                "local": self.local,
+                "remote": self.remote,
+                "remote_calls_avoided_rate": round(self.local / total, 4) if total else 0.0,
+                "threshold": CONFIDENCE_THRESHOLD,
+                "shadow_agreement": {
+                    label: {
+                        "compared": compared,
+                        "agreed": self.agreed[label],
+                        "rate": round(self.agreed[label] / compared, 4),
+                    }
+                    for label, compared in self.compared.items()
+                },
+            }
+
+
+classifier_stats = ClassifierStats()
+
+
+def classify_document(
+    content: bytes,
+    content_sha256: Optional[str] = None,
+    remote: Callable[..., str] = document_classifier,
+    threshold: Optional[float] = None,
+) -> str:
+    """Classify locally when confident, otherwise fall back to the Document AI classifier."""
+    threshold = CONFIDENCE_THRESHOLD if threshold is None else threshold
+    label, confidence = classify_locally(content)
+    if label is not None and confidence >= threshold:
+        classifier_stats.record(local=True)
+        return label
+
+    classifier_stats.record(local=False)
+    remote_label = remote(content, content_sha256=content_sha256)
+    if label is not None:
+        classifier_stats.record_agreement(label, remote_label)
+    return remote_label
+
+
+def evaluate(directory: str, use_remote: bool = False) -> dict:
+    """
+    Compare local guesses, and optionally the Document AI classifier, with the
+    labels of PDFs stored as `<directory>/<label>/*.pdf`. Agreement is counted
+    on routing (plain OCR vs form parser), which is all the label decides.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*", "*.pdf")))
+    results = {}
+    remote_agreed = 0
+    for path in paths:
+        truth = os.path.basename(os.path.dirname(path))
+        with open(path, "rb") as f:
+            content = f.read()
+        guess, confidence = classify_locally(content)
+        entry = results.setdefault(guess or "none", {"n": 0, "agreed": 0, "trusted": 0})
+        entry["n"] += 1
+        entry["trusted"] += int(guess is not None and confidence >= CONFIDENCE_THRESHOLD)
+        entry["agreed"] += int(guess is not None and _routes_to_ocr(guess) == _routes_to_ocr(truth))
+        if use_remote:
+            remote_agreed += int(_routes_to_ocr(document_classifier(content)) == _routes_to_ocr(truth))
+
+    for entry in results.values():
+        entry["rate"] = round(entry["agreed"] / entry["n"], 4)
+    report = {"pdfs": len(paths), "threshold": CONFIDENCE_THRESHOLD, "local": results}
+    if use_remote:
+        report["remote_rate"] = round(remote_agreed / len(paths), 4) if paths else None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    evaluate_parser = subparsers.add_parser("evaluate", help="Measure agreement on labelled PDFs")
+    evaluate_parser.add_argument("directory")
+    evaluate_parser.add_argument("--remote", action="store_true", help="Also run the Document AI classifier")
+    args = parser.parse_args()
+    print(json.dumps(evaluate(args.directory, args.remote), indent=2))
+
+
+if __name__ == "__main__":
+    main()
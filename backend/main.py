@@ -1,21 +1,42 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from google.api_core.client_options import ClientOptions
-from google.cloud import documentai
-from typing import Optional, List
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from typing import Optional, List, Tuple
 from DocumentAIProcessor import ocr_processing
 from FormParser import get_data
-from DocumentAIClassifier import document_classifier
-from Summarizer import summarize
+from Summarizer import summarize, summarize_stream
+import validate_formdata
 from validate_formdata import validate_form
-from feature_embeddings import get_embeddings
-import tempfile
+import asyncio
+import contextvars
+import json
+import time
 import os
-from FraudAgent import assess_fraud
+from concurrent.futures import ThreadPoolExecutor
+from FraudAgent import assess_fraud, embedding_batcher
+from embedding_store import embedding_store
+from policy_cache import get_policy_text, warm_policy_cache
+from docai_cache import document_cache
+from llm_cache import llm_cache
+from docai_clients import close_clients, get_client as get_docai_client
+import cohere_clients
+from pipeline import Stage, run_stages
+from local_classifier import classify_document, classifier_stats
+from documents import (
+    MAX_REQUEST_BYTES, MAX_REQUEST_FILES, MAX_UPLOAD_BYTES, UploadBuffer, UploadTooLarge, buffer_file,
+    read_document, read_upload,
+)
+from job_queue import QueueFull, job_queue
+import tracing
 
 
 app = FastAPI()
 
+# Document AI calls are blocking, so they run on this pool instead of the event loop.
+# Its size caps how many files are classified/extracted at once across all requests.
+DOCAI_CONCURRENCY = int(os.getenv("DOCAI_CONCURRENCY", "8"))
+docai_executor = ThreadPoolExecutor(max_workers=DOCAI_CONCURRENCY, thread_name_prefix="docai")
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -25,60 +46,340 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/upload")
-async def upload_file(files: List[UploadFile] = File(...)):
+def warm_remote_clients():
+    """Open the Document AI channel, Cohere clients and Pinecone index handle."""
+    get_docai_client()
+    cohere_clients.warm_up()
+    validate_formdata.warm_up()
+
+def warm_embedding_model():
+    # sentence_transformers (and torch) are only imported when this warm-up is enabled
+    from feature_embeddings import warm_up
+    warm_up()
+
+@app.on_event("startup")
+async def startup():
+    # Heavy SDKs and remote handles are otherwise created on first use, so each
+    # warm-up trades boot time and memory for a faster first request.
+    # OCR the policy once up front so the first claim doesn't pay for it
+    if os.getenv("WARM_POLICY_CACHE", "1") == "1":
+        await asyncio.to_thread(warm_policy_cache)
+    if os.getenv("WARM_REMOTE_CLIENTS", "0") == "1":
+        await asyncio.to_thread(warm_remote_clients)
+    if os.getenv("WARM_EMBEDDING_MODEL", "0") == "1":
+        await asyncio.to_thread(warm_embedding_model)
+
+    job_queue.start(run_job)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await job_queue.stop()
+    docai_executor.shutdown(wait=False)
+    await close_clients()
+    await cohere_clients.close_clients()
+
+def run_docai(func, *args):
+    """Run blocking work on the Document AI pool, carrying the request's context (e.g. tracing) along."""
+    return asyncio.get_running_loop().run_in_executor(docai_executor, contextvars.copy_context().run, func, *args)
+
+def load_file(upload: UploadBuffer) -> bytes:
+    # A single bytes copy per file is shared by the classifier, OCR and form parser.
+    # RawDocument needs bytes anyway; the copies live on the Document AI pool, so at
+    # most DOCAI_CONCURRENCY of them exist at once.
+    with upload.view() as view:
+        return read_document(view)
+
+def extract_file(doc_type: str, content: bytes, content_sha256: str) -> dict:
+    """OCR handwritten notes, extract form fields from everything else."""
+    if doc_type == "written_notes":
+        return {"doc_type": doc_type, "text": ocr_processing(content, content_sha256)}
+    return {"doc_type": doc_type, "json": get_data(content, content_sha256)}
+
+def process_file(upload: UploadBuffer, on_classified=None) -> dict:
+    """
+    Classify one uploaded file, then OCR it or extract its form fields.
+    `on_classified(doc_type)` is called in between, from the pool thread.
+    """
+    content = load_file(upload)
+    # Decided locally when the PDF structure is conclusive, remotely otherwise
+    doc_type = classify_document(content, upload.sha256)
+    if on_classified is not None:
+        on_classified(doc_type)
+    return extract_file(doc_type, content, upload.sha256)
+
+def combine_file_results(file_results: List[dict]):
+    combined_features = ""
+    last_json_text = None  # Keep track of the last JSON for validation
+    all_json_text = []  # Store all JSON data for fraud assessment
+
+    for result in file_results:
+        if result["doc_type"] == "written_notes":
+            combined_features += result["text"]
+        else:
+            json_text = result["json"]
+            last_json_text = json_text  # Store the last JSON
+            all_json_text.append(json_text)
+            combined_features += "This is a JSON: " + "\n".join([f"{key}: {value}" for key, value in json_text.items() if value.strip() != ""])
+
+    return combined_features, last_json_text, all_json_text
+
+def claim_stages(combined_features, last_json_text, all_json_text, policy_doc):
+    """Post-extraction stages that need form data, plus the values they consume."""
+    stages = []
+    if last_json_text:  # Only validate if we have JSON data
+        stages += [
+            Stage("validation", validate_form, inputs=("last_json_text",)),
+            Stage("fraud_risk", assess_fraud, inputs=("combined_json_texts", "policy_doc")),
+        ]
+    combined_json_texts = {key: value for json_text in all_json_text for key, value in json_text.items()}
+    values = {
+        "combined_features": combined_features,
+        "last_json_text": last_json_text,
+        "combined_json_texts": combined_json_texts,
+        "policy_doc": policy_doc,
+    }
+    return stages, values
+
+def close_uploads(uploads: List[UploadBuffer]) -> None:
+    for upload in uploads:
+        upload.close()
+
+async def read_uploads(files: List[UploadFile]) -> List[UploadBuffer]:
+    """Read a request's files, enforcing the per-file and per-request size limits (413)."""
+    if len(files) > MAX_REQUEST_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_REQUEST_FILES} files per request")
+    uploads = []
+    remaining = MAX_REQUEST_BYTES
+    try:
+        # Uploads are read in chunks, hashed as they arrive and spooled to disk when large
+        for file in files:
+            max_bytes = min(MAX_UPLOAD_BYTES, remaining)
+            try:
+                uploads.append(await read_upload(file, max_bytes=max_bytes))
+            except UploadTooLarge:
+                if max_bytes < MAX_UPLOAD_BYTES:
+                    raise UploadTooLarge(f"Request exceeds {MAX_REQUEST_BYTES} bytes in total")
+                raise
+            remaining -= uploads[-1].size
+    except UploadTooLarge as e:
+        close_uploads(uploads)
+        raise HTTPException(status_code=413, detail=str(e))
+    return uploads
+
+def policy_path() -> str:
+    # Get the current directory path and construct the full path to insurance_policy.pdf
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(current_dir, "insurance_policy.pdf")
+
+@tracing.traced("claim")
+async def run_claim(uploads: List[UploadBuffer], progress=None, on_file=None, on_result=None,
+                    summarize_fn=None) -> dict:
+    """
+    Run the full pipeline over already-read uploads and return the /upload payload.
+    `progress(update)` is called as files finish and when analysis starts,
+    `on_file(index, event, payload)` when a file is classified and when it is
+    extracted, and `on_result(stage, result)` as each analysis stage finishes.
+    `summarize_fn` produces the summary, e.g. a streaming variant; `summarize`
+    by default.
+    """
     all_results = {
         "summary": None,
         "validation": None
     }
 
-    # Get the current directory path and construct the full path to insurance_policy.pdf
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    policy_path = os.path.join(current_dir, "insurance_policy.pdf")
-    
-    policy_doc = ocr_processing(policy_path)
-    combined_features = ""
-    last_json_text = None  # Keep track of the last JSON for validation
-    all_json_text = []  # Store all JSON data for fraud assessment
-    
-    for file in files:
-        content = await file.read()
+    loop = asyncio.get_running_loop()
+    files_done = 0
 
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-            temp_file.write(content)
-            temp_path = temp_file.name
+    async def run_file(index: int, upload: UploadBuffer) -> dict:
+        nonlocal files_done
+        on_classified = None
+        if on_file is not None:
+            # Scheduled before the file's result is delivered, so events stay in order
+            def on_classified(doc_type):
+                loop.call_soon_threadsafe(on_file, index, "classification", {"doc_type": doc_type})
+        result = await run_docai(process_file, upload, on_classified)
+        files_done += 1
+        if on_file is not None:
+            on_file(index, "extraction", result)
+        if progress is not None:
+            progress({"step": "extract", "files_done": files_done, "files_total": len(uploads)})
+        return result
 
-        try:
-            doc_type = document_classifier(temp_path=temp_path)
-            
-            if doc_type == "written_notes":
-                raw_text = ocr_processing(temp_path)
-                combined_features += raw_text
-            else:
-                json_text = get_data(temp_path)
-                last_json_text = json_text  # Store the last JSON
-                all_json_text.append(json_text)
-                combined_features += "This is a JSON: " + "\n".join([f"{key}: {value}" for key, value in json_text.items() if value.strip() != ""])
+    # Files are processed concurrently; gather keeps results in upload order
+    extract_start = time.perf_counter()
+    policy_future = run_docai(get_policy_text, policy_path())
+    file_results = await asyncio.gather(*(run_file(index, upload) for index, upload in enumerate(uploads)))
+    policy_doc = await policy_future
+    timings = {"extract": round((time.perf_counter() - extract_start) * 1000, 1)}
 
-        finally:
-            os.unlink(temp_path)
-    
-    # Process combined results
+    combined_features, last_json_text, all_json_text = combine_file_results(file_results)
+
+    # Validation, fraud assessment and summarization are independent, so they run concurrently
     if combined_features:
-        if last_json_text:  # Only validate if we have JSON data
-            all_results["validation"] = validate_form(last_json_text)
-            # Assess fraud risk
-            combined_json_texts = {key: value for json_text in all_json_text for key, value in json_text.items()}
-            fraud_risk = assess_fraud(combined_json_texts, policy_doc)
-            all_results["fraud_risk"] = fraud_risk
-        all_results["summary"] = summarize(combined_features)
-    
+        if progress is not None:
+            progress({"step": "analyze", "files_done": files_done, "files_total": len(uploads)})
+        stages, values = claim_stages(combined_features, last_json_text, all_json_text, policy_doc)
+        # Looked up at call time, so replacing main.summarize (e.g. in benchmarks) takes effect
+        stages.insert(0, Stage("summary", summarize_fn or summarize, inputs=("combined_features",)))
+        stage_results, stage_timings = await run_stages(stages, values, on_result=on_result)
+        all_results.update(stage_results)
+        timings.update(stage_timings)
+
     return {
         "status": "success",
-        "message": f"Successfully processed {len(files)} files",
-        "data": all_results
+        "message": f"Successfully processed {len(uploads)} files",
+        "data": all_results,
+        "timings": timings
+    }
+
+@app.post("/upload")
+async def upload_file(files: List[UploadFile] = File(...), trace: bool = False):
+    """`?trace=true` adds a per-call timing breakdown to the response."""
+    uploads = await read_uploads(files)
+    try:
+        if not trace:
+            return await run_claim(uploads)
+        with tracing.request_trace() as spans:
+            result = await run_claim(uploads)
+        result["trace"] = tracing.breakdown(spans)
+        return result
+    finally:
+        close_uploads(uploads)
+
+async def stream_claim(uploads: List[UploadBuffer], filenames: List[str], trace: bool = False):
+    """
+    Run the /upload pipeline, yielding NDJSON events as results become available:
+    classification and extraction per file, then validation, fraud_risk,
+    summary_delta tokens, the full summary, and finally done (or error). With
+    `trace`, the done event carries the per-call timing breakdown.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: str, **payload):
+        queue.put_nowait({"event": event, **payload})
+
+    def on_file(index: int, event: str, payload: dict):
+        emit(event, file=index, filename=filenames[index], **payload)
+
+    async def stream_summary(text: str) -> str:
+        summary = ""
+        async for delta in summarize_stream(text):
+            summary += delta
+            emit("summary_delta", text=delta)
+        return summary
+
+    async def produce():
+        # Spans from this claim's calls are collected for the optional breakdown
+        with tracing.request_trace() as spans:
+            try:
+                result = await run_claim(
+                    uploads,
+                    on_file=on_file,
+                    on_result=lambda name, stage_result: emit(name, data=stage_result),
+                    summarize_fn=stream_summary,
+                )
+                done = {"message": result["message"], "timings": result["timings"]}
+                if trace:
+                    done["trace"] = tracing.breakdown(spans)
+                emit("done", **done)
+            except Exception as e:
+                emit("error", detail=str(e))
+            finally:
+                queue.put_nowait(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield json.dumps(event, default=str) + "\n"
+    finally:
+        producer.cancel()
+        close_uploads(uploads)
+
+class UploadsStreamingResponse(StreamingResponse):
+    """
+    Closes the request's uploads once the response is over, however it ends. A
+    client that disconnects before streaming starts never runs the generator's
+    own cleanup, and background tasks are skipped on disconnect.
+    """
+
+    def __init__(self, content, uploads: List[UploadBuffer], **kwargs):
+        super().__init__(content, **kwargs)
+        self.uploads = uploads
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # UploadBuffer.close is idempotent, so the generator may have closed them already
+            close_uploads(self.uploads)
+
+@app.post("/upload/stream")
+async def upload_file_stream(files: List[UploadFile] = File(...), trace: bool = False):
+    """Streaming variant of /upload that emits each stage's result as soon as it is ready."""
+    uploads = await read_uploads(files)
+    filenames = [file.filename for file in files]
+    return UploadsStreamingResponse(
+        stream_claim(uploads, filenames, trace), uploads, media_type="application/x-ndjson"
+    )
+
+async def run_job(files: List[Tuple[str, str]], progress) -> dict:
+    """Job queue handler: run the /upload pipeline over a job's stored files."""
+    uploads = []
+    try:
+        for _, path in files:
+            uploads.append(await asyncio.to_thread(buffer_file, path))
+        return await run_claim(uploads, progress)
+    finally:
+        close_uploads(uploads)
+
+@app.post("/jobs", status_code=202)
+async def create_job(files: List[UploadFile] = File(...)):
+    """Queue a claim for background processing and return its job ID immediately."""
+    uploads = await read_uploads(files)
+    try:
+        # Views are written straight to the job's files without another copy
+        contents = [(file.filename, upload.view()) for file, upload in zip(files, uploads)]
+        job_id = await asyncio.to_thread(job_queue.enqueue, contents)
+    except QueueFull as e:
+        # Backpressure: tell clients to retry rather than letting the backlog grow unbounded
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    finally:
+        close_uploads(uploads)
+    return {"status": "queued", "job_id": job_id}
+
+@app.get("/jobs/metrics")
+async def job_metrics():
+    return await asyncio.to_thread(job_queue.metrics)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "documentai": document_cache.stats(),
+        "embeddings": embedding_store.stats(),
+        "embed_batching": embedding_batcher.stats(),
+        # The LLM cache's stats query SQLite
+        "llm": await asyncio.to_thread(llm_cache.stats),
     }
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Per-stage latency, payload size, error and cache metrics in Prometheus text format."""
+    return PlainTextResponse(tracing.metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/classifier/stats")
+async def classifier_stats_endpoint():
+    return classifier_stats.stats()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0000", port=8000) 
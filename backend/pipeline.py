@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import inspect
+import time
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+
+@dataclass
+class Stage:
+    """A named pipeline step. `inputs` name the values (or other stages) it consumes."""
+    name: str
+    func: Callable[..., Any]
+    inputs: Sequence[str] = field(default_factory=tuple)
+
+
+async def run_stages(
+    stages: List[Stage],
+    values: Dict[str, Any],
+    executor: Optional[Executor] = None,
+    on_result: Optional[Callable[[str, Any], None]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """
+    Run a DAG of stages, starting each one as soon as its inputs are available.
+
+    `values` seeds the inputs that are not produced by a stage. Sync functions run
+    on `executor` (the loop's default pool if None) in a copy of the caller's
+    context, so context variables carry over; coroutine functions are awaited.
+    `on_result(name, output)` is called on the loop as each stage finishes.
+    Returns each stage's output and its wall time in milliseconds.
+    """
+    # Stages are started in declaration order, so a stage may only depend on earlier ones
+    names = {stage.name for stage in stages}
+    declared = set()
+    for stage in stages:
+        for name in stage.inputs:
+            if name in names and name not in declared:
+                raise ValueError(f"Stage '{stage.name}' depends on '{name}', which is not declared before it")
+            if name not in names and name not in values:
+                raise ValueError(f"Stage '{stage.name}' has unknown input '{name}'")
+        declared.add(stage.name)
+
+    loop = asyncio.get_running_loop()
+    tasks: Dict[str, asyncio.Task] = {}
+    results: Dict[str, Any] = {}
+    timings: Dict[str, float] = {}
+
+    async def run(stage: Stage) -> Any:
+        args = []
+        for name in stage.inputs:
+            args.append(await tasks[name] if name in tasks else values[name])
+        start = time.perf_counter()
+        if inspect.iscoroutinefunction(stage.func):
+            result = await stage.func(*args)
+        else:
+            result = await loop.run_in_executor(executor, contextvars.copy_context().run, stage.func, *args)
+        timings[stage.name] = round((time.perf_counter() - start) * 1000, 1)
+        results[stage.name] = result
+        if on_result is not None:
+            on_result(stage.name, result)
+        return result
+
+    for stage in stages:
+        tasks[stage.name] = asyncio.ensure_future(run(stage))
+
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+    return results, timings
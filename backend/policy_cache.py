@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from DocumentAIProcessor import ocr_processing, ocr_variant
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+POLICY_PATH = os.path.join(CURRENT_DIR, "insurance_policy.pdf")
+CACHE_DIR = os.getenv("POLICY_CACHE_DIR", os.path.join(CURRENT_DIR, ".cache", "policy"))
+
+# (path, mtime_ns, size) -> sha256, so unchanged files are not re-hashed per request
+_digests: Dict[Tuple[str, int, int], str] = {}
+# (sha256, OCR variant) -> OCR text
+_texts: Dict[Tuple[str, str], str] = {}
+_lock = threading.Lock()
+
+
+def file_sha256(file_path: str) -> str:
+    """Return the hex SHA-256 of a file, hashing only when its stat changes."""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    digest = _digests.get(key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                sha.update(block)
+        digest = sha.hexdigest()
+        _digests[key] = digest
+    return digest
+
+
+def _cache_file(digest: str, variant: str) -> str:
+    return os.path.join(CACHE_DIR, f"{digest}.{variant}.json")
+
+
+def _load(digest: str, variant: str) -> Optional[str]:
+    try:
+        with open(_cache_file(digest, variant), "r", encoding="utf-8") as f:
+            return json.load(f)["text"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _store(digest: str, variant: str, text: str) -> None:
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    # Write to a temp file and rename so concurrent workers never read a partial file
+    tmp_path = f"{_cache_file(digest, variant)}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"sha256": digest, "variant": variant, "text": text}, f)
+    os.replace(tmp_path, _cache_file(digest, variant))
+
+
+def get_policy_text(
+    policy_path: str = POLICY_PATH,
+    ocr: Callable[[str], str] = ocr_processing,
+    variant: Optional[str] = None,
+) -> str:
+    """
+    Return the OCR text of the policy document, keyed by the file's content hash
+    and the OCR variant (processor and page mode, `ocr_variant()` by default).
+
+    Lookups go memory -> disk -> Document AI. A changed PDF or a different
+    OCR_MODE makes a new key, so stale or page-1-only text is never returned.
+    """
+    key = (file_sha256(policy_path), variant or ocr_variant())
+    text = _texts.get(key)
+    if text is not None:
+        return text
+
+    with _lock:
+        text = _texts.get(key)
+        if text is None:
+            text = _load(*key)
+            if text is None:
+                text = ocr(policy_path)
+                _store(*key, text)
+            _texts.clear()
+            _texts[key] = text
+    return text
+
+
+def warm_policy_cache(policy_path: str = POLICY_PATH) -> None:
+    """Fill the cache ahead of the first request."""
+    try:
+        get_policy_text(policy_path)
+    except Exception as e:
+        # Startup should not fail if Document AI is unreachable; first use retries
+        print(f"Policy cache warm-up failed: {e}")
@@ -0,0 +1,21 @@
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Caches and the job store are module singletons configured at import time, so
+# point them at a throwaway directory before any test imports the backend
+_cache_dir = tempfile.mkdtemp(prefix="backend-tests-")
+for name, path in {
+    "DOCAI_CACHE_DIR": "documentai",
+    "POLICY_CACHE_DIR": "policy",
+    "LLM_CACHE_DB": "llm_cache.sqlite3",
+    "EMBEDDING_STORE_DIR": "embeddings",
+    "JOBS_DB": os.path.join("jobs", "jobs.sqlite"),
+    "JOBS_FILES_DIR": os.path.join("jobs", "files"),
+    "ATTACHMENTS_DIR": "attachments",
+}.items():
+    os.environ.setdefault(name, os.path.join(_cache_dir, path))
+os.environ["DOCAI_INSECURE"] = "1"
@@ -0,0 +1,120 @@
+"""
+/upload's per-file work against a fake Document AI server with injected
+latency: files run concurrently, results keep upload order, and validation
+gets the last form's fields.
+
+Run from backend/ (skipped when the backend's dependencies aren't installed):
+    python -m pytest tests
+"""
+import asyncio
+import os
+import re
+import time
+import uuid
+
+import pytest
+
+fakes = pytest.importorskip("benchmarks.fakes")
+main = pytest.importorskip("main")
+
+from google.cloud import documentai  # type: ignore  # noqa: E402
+
+from documents import UploadBuffer  # noqa: E402
+
+# Seconds per Document AI call; each file costs two (classify, then OCR or form parse)
+LATENCY = 0.25
+
+
+class ScriptedDocumentAIServer(fakes.FakeDocumentAIServer):
+    """
+    Answers from the document itself: `kind=form|notes;id=<n>;delay=<s>`. Forms
+    come back as a form with a `claim_id` field, notes as written_notes text.
+    """
+
+    def respond(self, request: documentai.ProcessRequest) -> documentai.Document:
+        spec = dict(re.findall(r"(\w+)=([\w.]+)", request.raw_document.content.decode()))
+        time.sleep(float(spec["delay"]))
+        if spec["kind"] == "form":
+            text = f"claim_id: {spec['id']}"
+            field = documentai.Document.Page.FormField(
+                field_name=fakes._layout(0, len("claim_id")), field_value=fakes._layout(10, len(text))
+            )
+            page = documentai.Document.Page(page_number=1, form_fields=[field])
+            return documentai.Document(
+                text=text, pages=[page], entities=[documentai.Document.Entity(type_="form", confidence=0.9)]
+            )
+        return documentai.Document(
+            text=f"[note {spec['id']}]",
+            entities=[documentai.Document.Entity(type_="written_notes", confidence=0.9)],
+        )
+
+
+@pytest.fixture(scope="module")
+def docai_server():
+    with ScriptedDocumentAIServer() as server:
+        previous = os.environ.get("DOCAI_API_ENDPOINT")
+        os.environ["DOCAI_API_ENDPOINT"] = server.address
+        yield server
+        if previous is None:
+            os.environ.pop("DOCAI_API_ENDPOINT", None)
+        else:
+            os.environ["DOCAI_API_ENDPOINT"] = previous
+
+
+@pytest.fixture
+def analysis(monkeypatch):
+    """Stand-ins for the policy and the LLM stages; records what validation received."""
+    received = {}
+
+    def validate_form(last_json_text):
+        received["validation"] = last_json_text
+        return "valid"
+
+    monkeypatch.setattr(main, "get_policy_text", lambda path: "policy")
+    monkeypatch.setattr(main, "validate_form", validate_form)
+    monkeypatch.setattr(main, "assess_fraud", lambda claim, policy: {"fraud_risk": "low"})
+    return received
+
+
+def upload(kind: str, number: int, delay: float = LATENCY) -> UploadBuffer:
+    # Not a PDF, so the local classifier defers to Document AI; the nonce keeps caches cold
+    buffer = UploadBuffer()
+    buffer.write(f"kind={kind};id={number};delay={delay};nonce={uuid.uuid4().hex}".encode())
+    return buffer
+
+
+def run_claim(uploads):
+    try:
+        start = time.perf_counter()
+        result = asyncio.run(main.run_claim(uploads, summarize_fn=lambda text: text))
+        return result, time.perf_counter() - start
+    finally:
+        main.close_uploads(uploads)
+
+
+def test_files_are_processed_concurrently(docai_server, analysis):
+    files = min(6, main.DOCAI_CONCURRENCY)
+    _, single = run_claim([upload("notes", 0)])
+    _, several = run_claim([upload("notes", i) for i in range(files)])
+
+    # Serial processing would take `files` times as long as one file
+    assert single >= 2 * LATENCY
+    assert several < single * 2
+
+
+def test_results_keep_upload_order(docai_server, analysis):
+    # Earlier files are slower, so they finish last
+    uploads = [upload("notes", i, delay=LATENCY * (4 - i) / 4) for i in range(4)]
+    result, _ = run_claim(uploads)
+
+    assert result["data"]["summary"] == "[note 0][note 1][note 2][note 3]"
+
+
+def test_validation_uses_last_uploaded_form(docai_server, analysis):
+    # The last form finishes first; upload order still decides which one is validated
+    uploads = [upload("form", 1, delay=LATENCY), upload("notes", 2), upload("form", 3, delay=0.01)]
+    result, _ = run_claim(uploads)
+
+    assert analysis["validation"] == {"claim_id": "3"}
+    assert result["data"]["validation"] == "valid"
+    assert result["data"]["fraud_risk"] == {"fraud_risk": "low"}
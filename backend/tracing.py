@@ -0,0 +1,182 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+PAYLOAD_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    """Per-stage latency and payload histograms plus call, error and cache counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency: Dict[str, Histogram] = {}
+        self.payload: Dict[str, Histogram] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.cache: Dict[Tuple[str, str], int] = {}
+
+    def record(self, span: "Span") -> None:
+        with self._lock:
+            self.latency.setdefault(span.name, Histogram(LATENCY_BUCKETS)).observe(span.seconds)
+            if span.payload_bytes is not None:
+                self.payload.setdefault(span.name, Histogram(PAYLOAD_BUCKETS)).observe(span.payload_bytes)
+            if span.error is not None:
+                key = (span.name, span.error)
+                self.errors[key] = self.errors.get(key, 0) + 1
+            if span.cache_hit is not None:
+                key = (span.name, "hit" if span.cache_hit else "miss")
+                self.cache[key] = self.cache.get(key, 0) + 1
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            self._render_histograms(lines, "claim_stage_seconds", "Latency of external calls by stage", self.latency)
+            self._render_histograms(
+                lines, "claim_stage_payload_bytes", "Request payload size by stage", self.payload
+            )
+            lines += ["# HELP claim_stage_errors_total Failed calls by stage and exception type",
+                      "# TYPE claim_stage_errors_total counter"]
+            for (stage, error), count in sorted(self.errors.items()):
+                lines.append(f'claim_stage_errors_total{{stage="{stage}",error="{error}"}} {count}')
+            lines += ["# HELP claim_stage_cache_total Cache lookups by stage and result",
+                      "# TYPE claim_stage_cache_total counter"]
+            for (stage, result), count in sorted(self.cache.items()):
+                lines.append(f'claim_stage_cache_total{{stage="{stage}",result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines: List[str], name: str, help_text: str, histograms: Dict[str, Histogram]) -> None:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for stage, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.total}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.total}')
+
+
+class Span:
+    __slots__ = ("name", "seconds", "payload_bytes", "cache_hit", "error")
+
+    def __init__(self, name: str, payload_bytes: Optional[int] = None):
+        self.name = name
+        self.seconds = 0.0
+        self.payload_bytes = payload_bytes
+        self.cache_hit: Optional[bool] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        record = {"stage": self.name, "ms": round(self.seconds * 1000, 1)}
+        if self.payload_bytes is not None:
+            record["payload_bytes"] = self.payload_bytes
+        if self.cache_hit is not None:
+            record["cache_hit"] = self.cache_hit
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+metrics = Metrics()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+# Spans finished while a request_trace() is active; carried into worker threads by copied contexts
+_request_spans: contextvars.ContextVar[Optional[List[Span]]] = contextvars.ContextVar("request_spans", default=None)
+
+
+@contextmanager
+def trace(name: str, payload_bytes: Optional[int] = None) -> Iterator[Span]:
+    """Time the enclosed call as stage `name`; the yielded span can carry payload size and cache result."""
+    span = Span(name, payload_bytes)
+    token = _current_span.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    except BaseException as e:
+        span.error = type(e).__name__
+        raise
+    finally:
+        span.seconds = time.perf_counter() - start
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            pass  # a generator finished in another context
+        metrics.record(span)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append(span)
+
+
+def traced(name: str):
+    """Decorator form of `trace` for sync functions and coroutine functions."""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with trace(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with trace(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def mark_cache(hit: bool) -> None:
+    """Record a cache lookup result on the innermost active span, if any."""
+    span = _current_span.get()
+    if span is not None:
+        # A span with several lookups counts as a hit only if all of them hit
+        span.cache_hit = hit if span.cache_hit is None else span.cache_hit and hit
+
+
+def set_payload(size: int) -> None:
+    span = _current_span.get()
+    if span is not None:
+        span.payload_bytes = (span.payload_bytes or 0) + size
+
+
+@contextmanager
+def request_trace() -> Iterator[List[Span]]:
+    """Collect every span finished inside this block (and in work it hands to copied contexts)."""
+    spans: List[Span] = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def breakdown(spans: List[Span]) -> dict:
+    """Per-request timing: every span in finish order, plus totals by stage."""
+    totals: Dict[str, dict] = {}
+    for span in spans:
+        total = totals.setdefault(span.name, {"calls": 0, "ms": 0.0})
+        total["calls"] += 1
+        total["ms"] = round(total["ms"] + span.seconds * 1000, 1)
+    return {"spans": [span.to_dict() for span in spans], "by_stage": totals}
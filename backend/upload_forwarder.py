@@ -0,0 +1,165 @@
+import asyncio
+import os
+import random
+import threading
+from concurrent.futures import Future
+from typing import List, Optional
+
+UPLOAD_URL = os.getenv("UPLOAD_URL", "http://localhost:8000/upload")
+MAX_IN_FLIGHT = int(os.getenv("FORWARD_MAX_IN_FLIGHT", "4"))
+# Emails accepted but not yet uploaded; submit() blocks beyond this
+MAX_PENDING = int(os.getenv("FORWARD_MAX_PENDING", "32"))
+MAX_RETRIES = int(os.getenv("FORWARD_MAX_RETRIES", "5"))
+BACKOFF_BASE = float(os.getenv("FORWARD_BACKOFF_SECONDS", "1"))
+BACKOFF_MAX = float(os.getenv("FORWARD_BACKOFF_MAX_SECONDS", "60"))
+TIMEOUT = float(os.getenv("FORWARD_TIMEOUT_SECONDS", "600"))
+
+# Statuses worth retrying; anything else (e.g. 413 too large) fails immediately
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadForwarder:
+    """
+    Long-lived client that forwards claim files to the backend's /upload. It runs
+    its own event loop on a background thread with one aiohttp session, so the
+    connection pool is reused across emails, and callers only wait when
+    `max_pending` emails are already queued.
+    """
+
+    def __init__(
+        self,
+        url: str = UPLOAD_URL,
+        max_in_flight: int = MAX_IN_FLIGHT,
+        max_pending: int = MAX_PENDING,
+        max_retries: int = MAX_RETRIES,
+        backoff_base: float = BACKOFF_BASE,
+    ):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        self._start_lock = threading.Lock()
+        self._futures: List[Future] = []
+        self.uploads = 0
+        self.retries = 0
+        self.failures = 0
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            ready = threading.Event()
+
+            def run():
+                self._loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(self._loop)
+                self._loop.run_until_complete(self._open())
+                ready.set()
+                self._loop.run_forever()
+
+            self._thread = threading.Thread(target=run, name="upload-forwarder", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    async def _open(self) -> None:
+        import aiohttp
+
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_in_flight),
+            timeout=aiohttp.ClientTimeout(total=TIMEOUT),
+        )
+
+    def submit(self, paths: List[str]) -> "Future[dict]":
+        """
+        Queue one /upload call carrying every file in `paths` (one claim) and
+        return a future for the response JSON.
+        """
+        if self._thread is None:
+            self._start()
+        self._pending.acquire()
+        future = asyncio.run_coroutine_threadsafe(self._upload(paths), self._loop)
+        future.add_done_callback(lambda _: self._pending.release())
+        self._futures = [f for f in self._futures if not f.done()] + [future]
+        return future
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), BACKOFF_MAX)
+            except ValueError:
+                pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(BACKOFF_MAX, self.backoff_base * 2 ** attempt))
+
+    async def _upload(self, paths: List[str]) -> dict:
+        import aiohttp
+
+        async with self._in_flight:
+            for attempt in range(self.max_retries + 1):
+                files = [open(path, "rb") for path in paths]
+                retry_after = None
+                try:
+                    form = aiohttp.FormData()
+                    for path, f in zip(paths, files):
+                        form.add_field("files", f, filename=os.path.basename(path), content_type="application/pdf")
+                    async with self._session.post(self.url, data=form) as response:
+                        if response.status == 200:
+                            self.uploads += 1
+                            # The claim was processed; an unreadable body must not upload it again
+                            try:
+                                return await response.json(content_type=None)
+                            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                                self.failures += 1
+                                raise UploadError(f"Uploaded, but the response could not be read: {e}") from e
+                        detail = f"{response.status}: {await response.text()}"
+                        if response.status not in RETRY_STATUSES:
+                            self.failures += 1
+                            raise UploadError(detail)
+                        retry_after = response.headers.get("Retry-After")
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    detail = str(e) or type(e).__name__
+                finally:
+                    for f in files:
+                        f.close()
+                if attempt == self.max_retries:
+                    break
+                self.retries += 1
+                delay = self._backoff(attempt, retry_after)
+                print(f"Upload of {len(paths)} files failed ({detail}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            self.failures += 1
+            raise UploadError(f"Giving up after {self.max_retries + 1} attempts: {detail}")
+
+    def drain(self) -> None:
+        """Wait for every submitted upload to finish."""
+        for future in list(self._futures):
+            try:
+                future.result()
+            except Exception:
+                pass  # reported through the future's callbacks
+
+    def close(self) -> None:
+        """Finish pending uploads, then close the session and stop the loop."""
+        if self._thread is None:
+            return
+        self.drain()
+        asyncio.run_coroutine_threadsafe(self._session.close(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def stats(self) -> dict:
+        return {"uploads": self.uploads, "retries": self.retries, "failures": self.failures}
+
+
+forwarder = UploadForwarder()
@@ -1,19 +1,39 @@
-from langchain.prompts import PromptTemplate
-from langchain.chains import LLMChain
-from langchain_cohere import ChatCohere
+import asyncio
 import json
+import threading
 from dotenv import load_dotenv
 import os
-from pinecone import Pinecone
+
+import cohere_clients
+import tracing
+from llm_cache import llm_cache
+from vector_index import query_index
 
 load_dotenv()
 
-pinecone_api_key = os.getenv("PINECONE_API_KEY")
-if pinecone_api_key is None:
-    raise ValueError("PINECONE_API_KEY environment variable is not set")
-pc = Pinecone(api_key=pinecone_api_key)
+# The Pinecone client and index handle are opened on first use (or by warm_up), not at import
+_pinecone = None
+_pinecone_lock = threading.Lock()
+
+def get_pinecone():
+    """Return the shared (Pinecone client, policy index handle) pair."""
+    global _pinecone
+    if _pinecone is None:
+        with _pinecone_lock:
+            if _pinecone is None:
+                from pinecone import Pinecone
+
+                pinecone_api_key = os.getenv("PINECONE_API_KEY")
+                if pinecone_api_key is None:
+                    raise ValueError("PINECONE_API_KEY environment variable is not set")
+                pc = Pinecone(api_key=pinecone_api_key)
+                _pinecone = (pc, pc.Index("genaigenesis"))
+    return _pinecone
 
-index = pc.Index("genaigenesis")
+def warm_up():
+    get_pinecone()
+
+VALIDATION_MODEL = "command-r-plus-08-2024"
 
 claim_data = {
   "patient_name": "Michael Lee",
@@ -26,31 +46,7 @@ claim_data = {
   "policy_expiration_date": "2025-03-01"
 }
 
-def validate_form(input_form_data):
-    # 👉 Initialize Cohere LLM
-    cohere_llm = ChatCohere(cohere_api_key=os.getenv("COHERE_API_KEY"))
-
-    claim_json = json.dumps(input_form_data)
-
-    embeddings = pc.inference.embed(
-        model="multilingual-e5-large",
-        inputs = claim_json,
-        parameters={"input_type": "query"}
-    )
-
-    # Step 2: Search Pinecone for relevant data
-    search_results = index.query(
-        namespace="insurance_policy",
-        vector=embeddings.get("data")[0]["values"],
-        top_k=3, 
-        include_metadata=True
-    )
-    
-    retrieved_policies = "\n\n".join(
-        [res["metadata"]['content'] for res in search_results["matches"]]
-    )
-
-    validation_prompt = PromptTemplate.from_template("""
+VALIDATION_PROMPT = """
         You are an expert insurance claim validator.  
         Below is an insurance claim JSON:
         {claim_json}
@@ -74,12 +70,44 @@ def validate_form(input_form_data):
 
         At the end, recommend one of: **APPROVE**, **FLAG**, or **DENY**, and explain your reasoning in 2-3 sentences.
         Only show answers and recommendation. Do not repeat the questions themselves. 
-        """)
-    
-    validation_chain = LLMChain(llm=cohere_llm, prompt=validation_prompt)
+        """
+
+@tracing.traced("retrieval")
+def retrieve_policies(claim_json):
+    """Policy excerpts most relevant to the claim, joined for the prompt."""
+    pc, index = get_pinecone()
+    embeddings = pc.inference.embed(
+        model="multilingual-e5-large",
+        inputs = claim_json,
+        parameters={"input_type": "query"}
+    )
+
+    # Step 2: Search the policy index (Pinecone or the local copy) for relevant data
+    search_results = query_index(
+        index,
+        namespace="insurance_policy",
+        vector=embeddings.get("data")[0]["values"],
+        top_k=3,
+        include_metadata=True
+    )
     
-    # Get the validation result and return it
-    result = validation_chain.run({"claim_json": claim_json, "retrieved_policies": retrieved_policies})
+    return "\n\n".join(
+        [res["metadata"]['content'] for res in search_results["matches"]]
+    )
+
+async def validate_form(input_form_data):
+    claim_json = json.dumps(input_form_data)
+
+    # Pinecone calls are blocking, so retrieval runs off the event loop
+    retrieved_policies = await asyncio.to_thread(retrieve_policies, claim_json)
+    messages = [{"role": "user", "content": VALIDATION_PROMPT.format(
+        claim_json=claim_json, retrieved_policies=retrieved_policies
+    )}]
+
+    # The key covers the retrieved excerpts, so policy changes invalidate cached validations
+    with tracing.trace("validation_llm", payload_bytes=len(messages[0]["content"].encode("utf-8"))):
+        result = await llm_cache.acomplete(
+            "validate_form", VALIDATION_MODEL, messages, None,
+            lambda: cohere_clients.chat(VALIDATION_MODEL, messages),
+        )
     return result  # Make sure we're returning the actual validation text
-    
-    
\ No newline at end of file
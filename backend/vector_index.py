@@ -0,0 +1,220 @@
+import json
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join(CURRENT_DIR, ".cache", "vector_index"))
+
+# "pinecone" queries the hosted index; "local" searches the in-process copy
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone")
+# "exact" scans every vector; "ivf" probes only the nearest coarse clusters
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact")
+LOCAL_INDEX_NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "4"))
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Spherical k-means; returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class LocalVectorIndex:
+    """
+    Read-only vector index for one namespace: a memory-mapped float32 matrix of
+    unit-norm embeddings plus a JSON file of ids and metadata. Queries return the
+    same shape as a Pinecone query response, scored by cosine similarity.
+
+    When built with clusters, rows are stored grouped by coarse centroid so IVF
+    search only scores the rows of the `nprobe` closest clusters.
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta["ids"]
+        self.metadata: List[dict] = meta["metadata"]
+        self.dim: int = meta["dim"]
+        self.offsets: Optional[List[int]] = meta.get("offsets")
+        self.vectors = np.memmap(
+            os.path.join(directory, "vectors.f32"), dtype=np.float32, mode="r", shape=(len(self.ids), self.dim)
+        )
+        self.centroids = None
+        if self.offsets is not None:
+            self.centroids = np.fromfile(os.path.join(directory, "centroids.f32"), dtype=np.float32).reshape(-1, self.dim)
+
+    @staticmethod
+    def write(directory: str, records: List[dict], clusters: Optional[int] = None) -> None:
+        """
+        Build an index from Pinecone-style records (`id`, `values`, `metadata`).
+        `clusters` adds the coarse quantizer; by default one is built for corpora
+        large enough to benefit (about sqrt(N) clusters).
+        """
+        os.makedirs(directory, exist_ok=True)
+        vectors = _normalize(np.asarray([record["values"] for record in records], dtype=np.float32))
+        if clusters is None and len(records) >= 1024:
+            clusters = int(np.sqrt(len(records)))
+
+        order = np.arange(len(records))
+        offsets = None
+        if clusters:
+            clusters = min(clusters, len(records))
+            centroids = _kmeans(vectors, clusters)
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            order = np.argsort(assignments, kind="stable")
+            offsets = np.searchsorted(assignments[order], np.arange(clusters + 1)).tolist()
+            centroids.astype(np.float32).tofile(os.path.join(directory, "centroids.f32.tmp"))
+            os.replace(os.path.join(directory, "centroids.f32.tmp"), os.path.join(directory, "centroids.f32"))
+
+        np.ascontiguousarray(vectors[order]).tofile(os.path.join(directory, "vectors.f32.tmp"))
+        meta = {
+            "dim": int(vectors.shape[1]),
+            "ids": [records[i]["id"] for i in order],
+            "metadata": [records[i].get("metadata", {}) for i in order],
+            "offsets": offsets,
+        }
+        with open(os.path.join(directory, "meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        # Vectors first, metadata last: meta.json is what readers open
+        os.replace(os.path.join(directory, "vectors.f32.tmp"), os.path.join(directory, "vectors.f32"))
+        os.replace(os.path.join(directory, "meta.json.tmp"), os.path.join(directory, "meta.json"))
+
+    def query(self, vector, top_k: int = 3, include_metadata: bool = True,
+              mode: str = LOCAL_INDEX_MODE, nprobe: int = LOCAL_INDEX_NPROBE,
+              metadata_filter: Optional[dict] = None) -> dict:
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if metadata_filter:
+            # Filtered search is exact over the rows whose metadata matches
+            rows = np.array([row for row, metadata in enumerate(self.metadata)
+                             if _matches_filter(metadata, metadata_filter)], dtype=np.int64)
+            scores = self.vectors[rows] @ query if len(rows) else np.empty(0, dtype=np.float32)
+        elif mode == "ivf" and self.centroids is not None:
+            nearest = np.argsort(self.centroids @ query)[::-1][:nprobe]
+            rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in nearest])
+            scores = self.vectors[rows] @ query
+        else:
+            rows = None
+            scores = self.vectors @ query
+
+        k = min(top_k, len(scores))
+        if k == 0:
+            return {"matches": []}
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        matches = []
+        for i in best:
+            row = int(rows[i]) if rows is not None else int(i)
+            match = {"id": self.ids[row], "score": float(scores[i])}
+            if include_metadata:
+                match["metadata"] = self.metadata[row]
+            matches.append(match)
+        return {"matches": matches}
+
+
+# Loaded indexes by namespace, with the meta.json signature they were loaded from
+_indexes: Dict[str, Tuple[tuple, LocalVectorIndex]] = {}
+_indexes_lock = threading.Lock()
+
+
+def namespace_dir(namespace: str) -> str:
+    return os.path.join(INDEX_DIR, namespace)
+
+
+def _meta_signature(namespace: str) -> tuple:
+    # A rebuild replaces meta.json last, giving it a new inode and mtime
+    stat = os.stat(os.path.join(namespace_dir(namespace), "meta.json"))
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def local_index(namespace: str) -> LocalVectorIndex:
+    """The namespace's index, reloaded when it has been rebuilt (e.g. by ingest_policies in another process)."""
+    signature = _meta_signature(namespace)
+    cached = _indexes.get(namespace)
+    if cached is None or cached[0] != signature:
+        with _indexes_lock:
+            cached = _indexes.get(namespace)
+            if cached is None or cached[0] != signature:
+                cached = (signature, LocalVectorIndex(namespace_dir(namespace)))
+                _indexes[namespace] = cached
+    return cached[1]
+
+
+def save_local_index(namespace: str, records: List[dict]) -> None:
+    """Replace the local copy of `namespace` with `records`."""
+    if records:
+        LocalVectorIndex.write(namespace_dir(namespace), records)
+    else:
+        shutil.rmtree(namespace_dir(namespace), ignore_errors=True)
+    with _indexes_lock:
+        _indexes.pop(namespace, None)
+
+
+def load_local_records(namespace: str) -> Dict[str, dict]:
+    """Return the local index's records by id, or nothing if it hasn't been built."""
+    try:
+        index = LocalVectorIndex(namespace_dir(namespace))
+    except FileNotFoundError:
+        return {}
+    return {
+        vector_id: {"id": vector_id, "values": index.vectors[row].tolist(), "metadata": index.metadata[row]}
+        for row, vector_id in enumerate(index.ids)
+    }
+
+
+def _matches_filter(metadata: dict, metadata_filter: dict) -> bool:
+    """Evaluate the subset of Pinecone's metadata filter language used here: equality, $eq, $in."""
+    for field, condition in metadata_filter.items():
+        value = metadata.get(field)
+        if isinstance(condition, dict):
+            if "$eq" in condition and value != condition["$eq"]:
+                return False
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def query_index(pinecone_index, namespace: str, vector, top_k: int = 3, include_metadata: bool = True,
+                metadata_filter: Optional[dict] = None):
+    """Top-k search against the configured retrieval backend."""
+    if RETRIEVAL_BACKEND == "local":
+        return local_index(namespace).query(
+            vector, top_k=top_k, include_metadata=include_metadata, metadata_filter=metadata_filter
+        )
+    options = {"filter": metadata_filter} if metadata_filter else {}
+    return pinecone_index.query(
+        namespace=namespace,
+        vector=vector,
+        top_k=top_k,
+        include_metadata=include_metadata,
+        **options,
+    )
+
+
+def sync_from_pinecone(pinecone_index, namespace: str, batch_size: int = 100) -> int:
+    """Copy every vector in a Pinecone namespace into the local index; returns the count."""
+    records = []
+    for ids in pinecone_index.list(namespace=namespace):
+        for start in range(0, len(ids), batch_size):
+            fetched = pinecone_index.fetch(ids=ids[start:start + batch_size], namespace=namespace)
+            for vector_id, vector in fetched.vectors.items():
+                records.append({"id": vector_id, "values": vector.values, "metadata": vector.metadata or {}})
+    save_local_index(namespace, records)
+    return len(records)